@@ -3,93 +3,210 @@ Batch Extractor - Process multiple URLs from the all_links.txt file
 """
 
 import asyncio
-import json
+import atexit
+import logging
+import os
+import queue
+import sqlite3
+import sys
+from collections import Counter
+from itertools import chain, zip_longest
+from logging.handlers import QueueHandler, QueueListener
 from pathlib import Path
-from typing import List
+from typing import Dict, List
+from urllib.parse import urlsplit
 import time
 
+import orjson
+
 from design_extractor import DesignExtractor
 from prompt_generator import generate_prompt_from_tokens
 
+# Log records are written to stdout on a background thread,
+# so the event loop never blocks on terminal output
+log = logging.getLogger("batch_extractor")
+log.setLevel(logging.INFO)
+log.propagate = False
+_log_queue = queue.SimpleQueue()
+log.addHandler(QueueHandler(_log_queue))
+_log_listener = QueueListener(_log_queue, logging.StreamHandler(sys.stdout))
+_log_listener.start()
+atexit.register(_log_listener.stop)
+
+URL_SCHEMES = ('http://', 'https://')
+STATE_COMMIT_EVERY = 100
+
+
+def interleave_by_host(urls: List[str]) -> List[str]:
+    """Reorder URLs round-robin across hosts so consecutive URLs hit different sites"""
+    by_host: Dict[str, List[str]] = {}
+    for url in urls:
+        by_host.setdefault(urlsplit(url).netloc, []).append(url)
+    return [url for url in chain.from_iterable(zip_longest(*by_host.values())) if url is not None]
+
+
+def write_prompt(tokens_file: Path):
+    """Generate the recreation prompt next to a tokens file, if it was written"""
+    if tokens_file.is_file():
+        prompt_file = tokens_file.parent / "recreation_prompt.md"
+        generate_prompt_from_tokens(tokens_file, prompt_file)
+
 
 async def process_urls_from_file(
     urls_file: Path, 
     output_dir: Path = None,
-    max_concurrent: int = 1,  # Set to 1 to avoid browser conflicts
+    max_concurrent: int = 1,  # 1 = sequential, <= 0 = unbounded
     delay_between_requests: float = 2.0
 ):
-    """Process multiple URLs from a file"""
+    """Process multiple URLs from a file
+    
+    max_concurrent == 1 processes URLs one after another; any other value
+    runs a pool of that many workers (one per URL when <= 0).
+    """
+    t0 = time.monotonic()
+    started_at = time.time_ns()
     
     if not urls_file.exists():
-        print(f"❌ URLs file not found: {urls_file}")
+        log.error("❌ URLs file not found: %s", urls_file)
         return
     
-    # Read URLs
-    with open(urls_file, 'r') as f:
-        urls = [line.strip() for line in f if line.strip()]
+    # Read URLs, stripping each line once and dropping duplicates while keeping order
+    with open(urls_file, 'r', buffering=1 << 18) as f:
+        urls = list(dict.fromkeys(s for line in f if (s := line.strip())))
     
     if not urls:
-        print("❌ No URLs found in file")
+        log.error("❌ No URLs found in file")
         return
     
     # Add protocol if missing
-    processed_urls = []
-    for url in urls:
-        if not url.startswith(('http://', 'https://')):
-            url = f'https://{url}'
-        processed_urls.append(url)
+    processed_urls = [url if url.startswith(URL_SCHEMES) else 'https://' + url for url in urls]
     
-    print(f"🚀 Processing {len(processed_urls)} URLs...")
+    out_dir = Path(output_dir or "extracted_designs")
+    out_dir.mkdir(parents=True, exist_ok=True)
     
-    # Initialize extractor
-    extractor = DesignExtractor(output_dir or "extracted_designs")
+    # Skip URLs that already completed in a previous run
+    state = sqlite3.connect(out_dir / "state.db")
+    state.execute('CREATE TABLE IF NOT EXISTS done(url TEXT PRIMARY KEY, site TEXT, ts REAL)')
+    done = {row[0] for row in state.execute('SELECT url FROM done')}
+    skipped = len(processed_urls)
+    processed_urls = [url for url in processed_urls if url not in done]
+    skipped -= len(processed_urls)
+    if skipped:
+        log.info("⏭️ Skipping %d URLs already processed in a previous run", skipped)
     
-    # Process URLs sequentially to avoid browser conflicts
-    results = []
+    if not processed_urls:
+        log.info("✅ All URLs already processed")
+        state.close()
+        return
+    
+    # Spread each host's URLs out so per-host delays overlap instead of queueing
+    processed_urls = interleave_by_host(processed_urls)
+    
+    log.info("🚀 Processing %d URLs...", len(processed_urls))
+    
+    # Per-host politeness: only URLs on the same host wait on each other
+    last_hit: Dict[str, float] = {}
+    
+    async def wait_for_host(url):
+        host = urlsplit(url).netloc
+        now = time.monotonic()
+        previous = last_hit.get(host)
+        slot = now if previous is None else max(now, previous + delay_between_requests)
+        # Reserve the slot before sleeping so concurrent workers queue up behind it
+        last_hit[host] = slot
+        if slot > now:
+            await asyncio.sleep(slot - now)
     
-    for url in processed_urls:
+    async def process_single_url(url):
         try:
-            print(f"🔄 Processing: {url}")
+            await wait_for_host(url)
+            log.info("🔄 Processing: %s", url)
             result = await extractor.extract_design(url)
             
-            # Generate prompt
+            # Generate prompt on a worker thread so other extractions keep running
             site_name = result.get('site_name', 'unknown')
-            tokens_file = Path(extractor.output_dir) / site_name / "design_tokens.json"
-            if tokens_file.exists():
-                prompt_file = tokens_file.parent / "recreation_prompt.md"
-                generate_prompt_from_tokens(tokens_file, prompt_file)
+            await asyncio.to_thread(write_prompt, out_dir / site_name / "design_tokens.json")
             
-            print(f"✅ Completed: {url}")
-            results.append({'url': url, 'status': 'success', 'site_name': site_name})
-            
-            # Rate limiting between requests
-            await asyncio.sleep(delay_between_requests)
+            log.info("✅ Completed: %s", url)
+            return {'url': url, 'status': 'success', 'site_name': site_name}
             
         except Exception as e:
-            print(f"❌ Failed: {url} - {str(e)}")
-            results.append({'url': url, 'status': 'failed', 'error': str(e)})
+            log.error("❌ Failed: %s - %s", url, e)
+            return {'url': url, 'status': 'failed', 'error': str(e)}
+    
+    # Per-URL results are streamed to JSON Lines as they complete; only counts stay in memory.
+    # The file is appended to so records from earlier, resumed runs are kept.
+    results_file = out_dir / "batch_results.jsonl"
+    counts = Counter()
+    
+    with open(results_file, 'ab', buffering=1 << 20) as results_fp:
+        
+        def record(entry):
+            results_fp.write(orjson.dumps(entry, option=orjson.OPT_APPEND_NEWLINE))
+            counts[entry['status']] += 1
+            if entry['status'] == 'success':
+                state.execute(
+                    'INSERT OR REPLACE INTO done VALUES (?, ?, ?)',
+                    (entry['url'], entry['site_name'], time.time())
+                )
+                if counts['success'] % STATE_COMMIT_EVERY == 0:
+                    state.commit()
+        
+        try:
+            # One browser is shared by every URL; sequential unless max_concurrent allows more
+            async with DesignExtractor(out_dir) as extractor:
+                workers = min(max_concurrent, len(processed_urls)) if max_concurrent > 0 else len(processed_urls)
+                # Keep ready contexts so URLs start without context setup; the pool is capped
+                # so an unbounded worker count does not open a context per URL up front
+                await extractor.warmup(min(workers, os.cpu_count() or 1))
+                if max_concurrent == 1:
+                    for url in processed_urls:
+                        record(await process_single_url(url))
+                else:
+                    # Fixed pool of workers draining a queue keeps memory constant in the URL count
+                    url_queue = asyncio.Queue()
+                    for url in processed_urls:
+                        url_queue.put_nowait(url)
+                    
+                    async def worker():
+                        while not url_queue.empty():
+                            url = url_queue.get_nowait()
+                            record(await process_single_url(url))
+                    
+                    await asyncio.gather(*(worker() for _ in range(workers)))
+        finally:
+            state.commit()
+            state.close()
+            results_fp.flush()
+            os.fsync(results_fp.fileno())
     
     # Summary
-    successful = sum(1 for r in results if isinstance(r, dict) and r.get('status') == 'success')
-    failed = len(results) - successful
+    successful = counts['success']
+    failed = counts['failed']
     
-    print(f"\n📊 Processing Summary:")
-    print(f"   ✅ Successful: {successful}")
-    print(f"   ❌ Failed: {failed}")
-    print(f"   📁 Output directory: {extractor.output_dir}")
+    log.info("\n📊 Processing Summary:")
+    log.info("   ✅ Successful: %d", successful)
+    log.info("   ❌ Failed: %d", failed)
+    log.info("   ⏭️ Skipped: %d", skipped)
+    log.info("   📁 Output directory: %s", out_dir)
     
     # Save summary
-    summary_file = Path(extractor.output_dir) / "batch_summary.json"
-    with open(summary_file, 'w') as f:
-        json.dump({
-            'total_urls': len(processed_urls),
-            'successful': successful,
-            'failed': failed,
-            'results': results,
-            'timestamp': time.time()
-        }, f, indent=2)
-    
-    print(f"📋 Summary saved to: {summary_file}")
+    # Write to a temp file and swap it in so readers never see a partial summary
+    summary_file = out_dir / "batch_summary.json"
+    tmp_file = summary_file.with_suffix('.json.tmp')
+    tmp_file.write_bytes(orjson.dumps({
+        'total_urls': len(processed_urls),
+        'successful': successful,
+        'failed': failed,
+        'skipped': skipped,
+        'results_file': results_file.name,
+        'started_at_ns': started_at,
+        'duration_s': round(time.monotonic() - t0, 3)
+    }, option=orjson.OPT_INDENT_2))
+    os.replace(tmp_file, summary_file)
+    
+    log.info("📋 Summary saved to: %s", summary_file)
+    log.info("📋 Per-URL results saved to: %s", results_file)
 
 
 async def main():
@@ -97,7 +214,7 @@ async def main():
     urls_file = Path("links.txt")
     
     if not urls_file.exists():
-        print("❌ links.txt not found. Please create it with URLs to process.")
+        log.error("❌ links.txt not found. Please create it with URLs to process.")
         return
     
     await process_urls_from_file(
@@ -109,4 +226,10 @@ async def main():
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    # uvloop is optional (and unavailable on Windows, where the default proactor loop is used)
+    try:
+        import uvloop
+    except ImportError:
+        asyncio.run(main())
+    else:
+        uvloop.run(main())
\ No newline at end of file
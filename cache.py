@@ -0,0 +1,57 @@
+"""
+Response Cache - SQLite store for model responses keyed on a hash of their inputs
+"""
+
+import hashlib
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+CACHE_PATH = Path(__file__).parent / "gemini_cache.db"
+
+_connection: Optional[sqlite3.Connection] = None
+# Callers may run on worker threads; the shared connection is used by one at a time
+_lock = threading.Lock()
+
+
+def _connect() -> sqlite3.Connection:
+    """Open the cache database on first use"""
+    global _connection
+    if _connection is None:
+        _connection = sqlite3.connect(CACHE_PATH, check_same_thread=False)
+        _connection.execute('PRAGMA journal_mode=WAL')
+        _connection.execute(
+            'CREATE TABLE IF NOT EXISTS responses('
+            'key TEXT PRIMARY KEY, model TEXT, created_at INTEGER, response BLOB)'
+        )
+    return _connection
+
+
+def make_key(*parts: bytes) -> str:
+    """Hash the request inputs into a cache key"""
+    digest = hashlib.sha256()
+    for part in parts:
+        # Length-prefix each part so different splits of the same bytes never collide
+        digest.update(len(part).to_bytes(8, 'big'))
+        digest.update(part)
+    return digest.hexdigest()
+
+
+def get(key: str) -> Optional[str]:
+    """Return the cached response for key, if any"""
+    with _lock:
+        row = _connect().execute('SELECT response FROM responses WHERE key = ?', (key,)).fetchone()
+    return row[0].decode('utf-8') if row else None
+
+
+def put(key: str, model: str, response: str):
+    """Store a response"""
+    with _lock:
+        connection = _connect()
+        connection.execute(
+            'INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)',
+            (key, model, int(time.time()), response.encode('utf-8'))
+        )
+        connection.commit()
@@ -3,21 +3,28 @@ Design Token Extractor - Extract design tokens from websites using Playwright
 """
 
 import asyncio
-import json
+import functools
+import hashlib
+import io
 import os
 import logging
 import time
 from pathlib import Path
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Literal, Optional, Tuple
 from urllib.parse import urlparse
 import re
-from collections import Counter
 
-from playwright.async_api import async_playwright, Page, Browser
+import orjson
+from playwright.async_api import async_playwright, Page, Browser, BrowserContext, TimeoutError as PlaywrightTimeoutError
 from PIL import Image
 import numpy as np
-from sklearn.cluster import KMeans
+from sklearn.cluster import MiniBatchKMeans
+from threadpoolctl import threadpool_limits
 import colorsys
+try:
+    import httpx  # optional, only needed for download_assets
+except ImportError:
+    httpx = None
 from rich.console import Console
 from rich.logging import RichHandler
 from rich.progress import Progress, SpinnerColumn, TextColumn, BarColumn, TaskProgressColumn
@@ -32,161 +39,91 @@ logging.basicConfig(
 )
 logger = logging.getLogger("design_extractor")
 
+# Color string parsers used by _color_to_rgb
+_RGB_RE = re.compile(r'rgba?\(([\d.,\s]+)')
+_HEX_RE = re.compile(r'#([0-9a-fA-F]{3}|[0-9a-fA-F]{6})')
+_NUMBER_RE = re.compile(r'[\d.]+')
 
-class DesignExtractor:
-    def __init__(self, output_dir: str = "extracted_designs"):
-        self.output_dir = Path(output_dir)
-        self.output_dir.mkdir(exist_ok=True)
-        logger.info(f"🚀 Design Extractor initialized with output directory: {self.output_dir}")
-        
-    async def extract_design(self, url: str, site_name: Optional[str] = None) -> Dict[str, Any]:
-        """Main extraction method"""
-        start_time = time.time()
-        
-        if not site_name:
-            site_name = urlparse(url).netloc.replace("www.", "")
-        
-        site_dir = self.output_dir / site_name
-        site_dir.mkdir(exist_ok=True)
-        
-        logger.info(f"🌐 Starting extraction for: {url}")
-        logger.info(f"📁 Output directory: {site_dir}")
-        
-        async with async_playwright() as p:
-            logger.info("🎭 Launching Playwright browser...")
-            browser = await p.chromium.launch(headless=True)
-            context = await browser.new_context(
-                viewport={'width': 1920, 'height': 1080},
-                user_agent='Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36'
-            )
-            page = await context.new_page()
-            
-            try:
-                # Navigate and wait for content
-                logger.info(f"🚀 Navigating to {url}...")
-                await page.goto(url, wait_until='domcontentloaded', timeout=60000)
-                await page.wait_for_timeout(3000)  # Additional wait for dynamic content
-                logger.info("✅ Page loaded successfully")
-                
-                # Extract all design tokens
-                with Progress(
-                    SpinnerColumn(),
-                    TextColumn("[progress.description]{task.description}"),
-                    BarColumn(),
-                    TaskProgressColumn(),
-                    console=console
-                ) as progress:
-                    
-                    extraction_task = progress.add_task("Extracting design tokens...", total=9)
-                    
-                    logger.info("📸 Taking screenshot...")
-                    screenshot = await self._take_screenshot(page, site_dir)
-                    progress.update(extraction_task, advance=1)
-                    
-                    logger.info("📄 Extracting HTML...")
-                    html = await self._extract_html(page, site_dir)
-                    progress.update(extraction_task, advance=1)
-                    
-                    logger.info("🏷️ Extracting design tokens...")
-                    tokens = await self._extract_tokens(page)
-                    progress.update(extraction_task, advance=1)
-                    
-                    logger.info("🎨 Analyzing CSS coverage...")
-                    css_coverage = await self._extract_css_coverage(page, site_dir)
-                    progress.update(extraction_task, advance=1)
-                    
-                    logger.info("🗂️ Extracting assets...")
-                    assets = await self._extract_assets(page, site_dir)
-                    progress.update(extraction_task, advance=1)
-                    
-                    logger.info("📱 Analyzing breakpoints...")
-                    breakpoints = await self._extract_breakpoints(page)
-                    progress.update(extraction_task, advance=1)
-                    
-                    logger.info("✨ Extracting animations...")
-                    animations = await self._extract_animations(page)
-                    progress.update(extraction_task, advance=1)
-                    
-                    logger.info("👆 Analyzing interactions...")
-                    interactions = await self._extract_interactions(page, site_dir)
-                    progress.update(extraction_task, advance=1)
-                    
-                    results = {
-                        'url': url,
-                        'site_name': site_name,
-                        'screenshot': screenshot,
-                        'html': html,
-                        'tokens': tokens,
-                        'css_coverage': css_coverage,
-                        'assets': assets,
-                        'responsive_breakpoints': breakpoints,
-                        'animations': animations,
-                        'interactions': interactions
-                    }
-                    
-                    # Post-process tokens
-                    logger.info("🔄 Processing tokens into design system...")
-                    processed = self._process_tokens(results['tokens'])
-                    results.update(processed)
-                    progress.update(extraction_task, advance=1)
-                    
-                    # Save results
-                    logger.info("💾 Saving results...")
-                    await self._save_results(results, site_dir)
-                    
-                    elapsed_time = time.time() - start_time
-                    logger.info(f"✅ Extraction completed in {elapsed_time:.2f}s")
-                    
-                    return results
-                
-            finally:
-                await browser.close()
-                logger.info("🔒 Browser closed")
-    
-    async def _take_screenshot(self, page: Page, site_dir: Path) -> str:
-        """Take full page screenshot"""
-        screenshot_path = site_dir / "screenshot.png"
-        await page.screenshot(path=str(screenshot_path), full_page=True)
-        return str(screenshot_path)
-    
-    async def _extract_html(self, page: Page, site_dir: Path) -> str:
-        """Extract rendered HTML"""
-        html_path = site_dir / "page.html"
-        content = await page.content()
-        with open(html_path, 'w', encoding='utf-8') as f:
-            f.write(content)
-        return str(html_path)
-    
-    async def _extract_tokens(self, page: Page) -> List[Dict[str, Any]]:
-        """Extract computed style tokens from visible elements"""
-        logger.debug("🔍 Evaluating page JavaScript to extract tokens...")
-        tokens = await page.evaluate("""
-            () => {
-                const elements = Array.from(document.querySelectorAll('*'))
-                    .filter(el => {
-                        const rect = el.getBoundingClientRect();
-                        const style = getComputedStyle(el);
-                        return rect.width * rect.height > 0 && 
-                               style.display !== 'none' && 
-                               style.visibility !== 'hidden';
-                    })
-                    .slice(0, 500); // Limit for performance
-                
-                return elements.map(el => {
-                    const style = getComputedStyle(el);
-                    const rect = el.getBoundingClientRect();
-                    
-                    return {
-                        tag: el.tagName.toLowerCase(),
-                        classes: el.className,
-                        id: el.id,
-                        text: el.textContent?.trim().substring(0, 100) || '',
-                        position: {
-                            x: Math.round(rect.x),
-                            y: Math.round(rect.y),
-                            width: Math.round(rect.width),
-                            height: Math.round(rect.height)
-                        },
+# Class/tag substrings that identify component examples
+COMPONENT_PATTERNS = {
+    'buttons': ('button', 'btn', 'cta'),
+    'cards': ('card', 'item', 'post'),
+    'headers': ('header', 'nav', 'navigation'),
+    'footers': ('footer',)
+}
+COMPONENT_EXAMPLE_LIMIT = 5
+
+# Spacing values kept in the scale even when they are not multiples of 4
+SPECIAL_SPACING_VALUES = frozenset({2, 6, 10, 12, 14, 18, 20, 24, 28, 36, 44, 48, 52, 56, 60, 64, 72, 80, 96})
+_SPECIAL_SPACING_ARRAY = np.array(sorted(SPECIAL_SPACING_VALUES), dtype=np.int64)
+
+# Palettes with at most this many distinct colors are kept whole instead of clustered
+SMALL_PALETTE_SIZE = 32
+
+# Connection pool for downloading page assets (fonts, stylesheets, images)
+ASSET_DOWNLOAD_CONNECTIONS = 16
+
+VIEWPORT = {'width': 1920, 'height': 1080}
+USER_AGENT = 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36'
+# Upper bound on idle contexts kept warm, however many workers there are
+MAX_WARM_CONTEXTS = min(8, os.cpu_count() or 1)
+
+# JPEG keeps full-page captures small; screenshots are a visual reference, not pixel data
+SCREENSHOT_QUALITY = 80
+# Pages taller than this are captured in clipped tiles and stitched, bounding browser memory
+SCREENSHOT_MAX_FULL_PAGE_HEIGHT = 8000
+SCREENSHOT_TILE_HEIGHT = 4000
+# Tiles are stitched up to this height (well under JPEG's 65500px limit, bounding the composite's memory);
+# tiles below it are saved as screenshot_<n> files instead. A multiple of the tile height.
+SCREENSHOT_MAX_STITCHED_HEIGHT = 4 * SCREENSHOT_TILE_HEIGHT
+# Cached extractions older than this are deleted and re-run
+CACHE_TTL_SECONDS = 24 * 60 * 60
+# Most recently written extractions kept in the cache; older ones are evicted
+CACHE_MAX_ENTRIES = 500
+# The cache lookup fetch is abandoned after this long so a slow origin is not waited on twice
+CACHE_LOOKUP_TIMEOUT_MS = 5000
+
+# Requests that never contribute to the extracted design and are aborted
+BLOCKED_RESOURCE_TYPES = frozenset({'media', 'websocket', 'manifest'})
+TRACKER_URL_RE = re.compile(
+    r'google-analytics\.com|googletagmanager\.com|doubleclick\.net|googlesyndication\.com'
+    r'|hotjar\.com|segment\.(?:io|com)|facebook\.com/tr|connect\.facebook\.net'
+    r'|mixpanel\.com|clarity\.ms'
+)
+
+# Collects tokens, breakpoints, animations and interactive elements in one round-trip
+EXTRACT_PAGE_DATA_JS = """
+() => {
+    const extractTokens = () => {
+        const SKIP_TAGS = new Set(['HEAD', 'SCRIPT', 'STYLE', 'META', 'LINK', 'NOSCRIPT', 'TEMPLATE']);
+        const walker = document.createTreeWalker(document.documentElement, NodeFilter.SHOW_ELEMENT, {
+            acceptNode: el => SKIP_TAGS.has(el.tagName) ? NodeFilter.FILTER_REJECT : NodeFilter.FILTER_ACCEPT
+        });
+
+        // Templated siblings (list items, grid cells) share computed styles, so
+        // read getComputedStyle once per tag/class/id/inline-style combination.
+        // The cache is capped; once full, new combinations are read uncached.
+        const STYLE_CACHE_LIMIT = 3000;
+        // Margin/padding strings repeat heavily ("0px"), so tokens carry indices into one palette
+        const spacingPalette = [];
+        const spacingIndex = new Map();
+        const intern = value => {
+            let i = spacingIndex.get(value);
+            if (i === undefined) {
+                i = spacingPalette.push(value) - 1;
+                spacingIndex.set(value, i);
+            }
+            return i;
+        };
+        const styleCache = new Map();
+        const snapshot = el => {
+            const key = el.tagName + '|' + (el.getAttribute('class') || '') + '|' + el.id + '|' + (el.getAttribute('style') || '');
+            let snap = styleCache.get(key);
+            if (!snap) {
+                const style = getComputedStyle(el);
+                snap = {
+                    hidden: style.display === 'none' || style.visibility === 'hidden',
+                    styles: {
                         typography: {
                             fontFamily: style.fontFamily,
                             fontSize: style.fontSize,
@@ -203,8 +140,8 @@ class DesignExtractor:
                             borderColor: style.borderColor
                         },
                         spacing: {
-                            margin: [style.marginTop, style.marginRight, style.marginBottom, style.marginLeft],
-                            padding: [style.paddingTop, style.paddingRight, style.paddingBottom, style.paddingLeft]
+                            margin: [style.marginTop, style.marginRight, style.marginBottom, style.marginLeft].map(intern),
+                            padding: [style.paddingTop, style.paddingRight, style.paddingBottom, style.paddingLeft].map(intern)
                         },
                         borders: {
                             borderWidth: style.borderWidth,
@@ -226,15 +163,599 @@ class DesignExtractor:
                             opacity: style.opacity,
                             transition: style.transition
                         }
-                    };
-                });
+                    }
+                };
+                // Elements with the same tag, classes and computed styles are one token
+                snap.sig = el.tagName + '|' + (el.getAttribute('class') || '') + '|' + JSON.stringify(snap.styles);
+                if (styleCache.size < STYLE_CACHE_LIMIT) styleCache.set(key, snap);
+            }
+            return snap;
+        };
+
+        // Numeric values parsed here so Python does not re-parse style strings:
+        // positive margin/padding pixels, and an RGB triple per unique color
+        const usedSpacing = new Set();
+        const colorRgb = {};
+        const rgbToArr = s => {
+            const m = s.match(/^rgba?\\(\\s*([\\d.]+)[,\\s]+([\\d.]+)[,\\s]+([\\d.]+)/);
+            return m ? [Math.trunc(+m[1]), Math.trunc(+m[2]), Math.trunc(+m[3])] : null;
+        };
+        const addMetrics = styles => {
+            for (const i of [...styles.spacing.margin, ...styles.spacing.padding]) usedSpacing.add(i);
+            for (const color of Object.values(styles.colors)) {
+                if (color && !(color in colorRgb)) colorRgb[color] = rgbToArr(color);
             }
-        """)
-        logger.debug(f"📊 Extracted {len(tokens)} design tokens from visible elements")
-        return tokens
+        };
+
+        // Walk the DOM until 500 distinct styles are found among at most 5000 visible
+        // elements (limits for performance). Repeats only bump the exemplar's count.
+        // Nothing here writes to the DOM, so interleaved layout/style reads stay cheap.
+        const tokens = [];
+        const bySignature = new Map();
+        let scanned = 0;
+        for (let el = walker.currentNode; el && tokens.length < 500 && scanned < 5000; el = walker.nextNode()) {
+            const rect = el.getBoundingClientRect();
+            if (rect.width * rect.height === 0) continue;
+            const snap = snapshot(el);
+            if (snap.hidden) continue;
+            scanned++;
+            const exemplar = bySignature.get(snap.sig);
+            if (exemplar) {
+                exemplar.count++;
+                continue;
+            }
+            // Only unique values matter downstream, so each snapshot contributes once
+            if (!snap.counted) {
+                addMetrics(snap.styles);
+                snap.counted = true;
+            }
+
+            const token = {
+                tag: el.tagName.toLowerCase(),
+                classes: el.className,
+                id: el.id,
+                text: el.textContent?.trim().substring(0, 100) || '',
+                position: {
+                    x: Math.round(rect.x),
+                    y: Math.round(rect.y),
+                    width: Math.round(rect.width),
+                    height: Math.round(rect.height)
+                },
+                count: 1,
+                ...snap.styles
+            };
+            bySignature.set(snap.sig, token);
+            tokens.push(token);
+        }
+        const spacingPx = [];
+        for (const i of usedSpacing) {
+            const value = spacingPalette[i];
+            const px = Math.trunc(parseFloat(value));
+            if (value.endsWith('px') && px > 0) spacingPx.push(px);
+        }
+        return { tokens, metrics: { spacingPx, colorRgb, spacingPalette } };
+    };
+
+    const extractBreakpoints = () => {
+        const breakpoints = [];
+        for (const sheet of document.styleSheets) {
+            try {
+                for (const rule of sheet.cssRules) {
+                    if (rule.type === CSSRule.MEDIA_RULE) {
+                        const mediaText = rule.media.mediaText;
+                        const widthMatch = mediaText.match(/(?:min-width|max-width):\\s*(\\d+)px/g);
+                        if (widthMatch) {
+                            breakpoints.push({
+                                mediaText: mediaText,
+                                widths: widthMatch
+                            });
+                        }
+                    }
+                }
+            } catch (e) {
+                // Skip external stylesheets due to CORS
+            }
+        }
+        return breakpoints;
+    };
+
+    const extractAnimations = () => {
+        const animations = [];
+        const keyframes = [];
+
+        // Extract @keyframes
+        for (const sheet of document.styleSheets) {
+            try {
+                for (const rule of sheet.cssRules) {
+                    if (rule.type === CSSRule.KEYFRAMES_RULE) {
+                        keyframes.push({
+                            name: rule.name,
+                            keyframes: Array.from(rule.cssRules).map(kr => ({
+                                keyText: kr.keyText,
+                                style: kr.style.cssText
+                            }))
+                        });
+                    }
+                }
+            } catch (e) {
+                // Skip external stylesheets
+            }
+        }
+
+        // Extract active animations
+        document.getAnimations().forEach(anim => {
+            animations.push({
+                animationName: anim.animationName,
+                duration: anim.effect?.getTiming().duration,
+                iterations: anim.effect?.getTiming().iterations,
+                playState: anim.playState
+            });
+        });
+
+        return { animations, keyframes };
+    };
+
+    const findInteractiveElements = () => {
+        const selectors = ['button', 'a', 'input', '[role="button"]', '.btn'];
+        const elements = [];
+
+        selectors.forEach(selector => {
+            document.querySelectorAll(selector).forEach((el, i) => {
+                const rect = el.getBoundingClientRect();
+                if (rect.width > 0 && rect.height > 0) {
+                    elements.push({
+                        selector: selector,
+                        index: i,
+                        x: rect.x + rect.width / 2,
+                        y: rect.y + rect.height / 2,
+                        classes: el.className,
+                        tag: el.tagName.toLowerCase()
+                    });
+                }
+            });
+        });
+
+        return elements.slice(0, 10); // Limit for performance
+    };
+
+    const { tokens, metrics } = extractTokens();
+    return {
+        tokens,
+        metrics,
+        breakpoints: extractBreakpoints(),
+        animations: extractAnimations(),
+        interactiveElements: findInteractiveElements()
+    };
+}
+"""
+
+
+class DesignExtractor:
+    def __init__(
+        self,
+        output_dir: str = "extracted_designs",
+        screenshot_format: Literal['png', 'jpeg'] = 'jpeg',
+        download_assets: bool = False,
+        html_format: Literal['html', 'mhtml'] = 'html'
+    ):
+        self.output_dir = Path(output_dir)
+        self.screenshot_format = screenshot_format
+        self.html_format = html_format
+        if download_assets and httpx is None:
+            logger.warning("⚠️ httpx is not installed, asset downloading is disabled")
+        self.download_assets = download_assets and httpx is not None
+        self.output_dir.mkdir(exist_ok=True)
+        self._playwright = None
+        self._browser: Optional[Browser] = None
+        self._browser_lock = asyncio.Lock()
+        # Rich allows only one live display at a time, so only one concurrent extraction shows progress
+        self._progress_active = False
+        # Idle contexts created ahead of time by warmup(); each is used for one site only
+        self._context_pool: asyncio.Queue = asyncio.Queue()
+        self._pool_size = 0
+        self._pool_tasks = set()
+        # Results keyed on a hash of the URL, served HTML, viewport and output options
+        self._cache_dir = self.output_dir / ".cache"
+        logger.info(f"🚀 Design Extractor initialized with output directory: {self.output_dir}")
+    
+    async def __aenter__(self) -> "DesignExtractor":
+        await self._ensure_browser()
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.aclose()
+    
+    async def _ensure_browser(self) -> Browser:
+        """Start Playwright and launch the shared browser on first use"""
+        async with self._browser_lock:
+            if self._browser is None:
+                logger.info("🎭 Launching Playwright browser...")
+                self._playwright = await async_playwright().start()
+                self._browser = await self._playwright.chromium.launch(headless=True)
+        return self._browser
+    
+    async def warmup(self, n: int = 4):
+        """Pre-create n browser contexts (at most MAX_WARM_CONTEXTS) so upcoming extractions skip context setup"""
+        n = min(n, MAX_WARM_CONTEXTS)
+        self._pool_size = n
+        missing = n - self._context_pool.qsize()
+        if missing > 0:
+            for context in await asyncio.gather(*(self._new_context() for _ in range(missing))):
+                self._context_pool.put_nowait(context)
+            logger.info(f"🔥 Warmed up {missing} browser contexts")
+    
+    async def _new_context(self, storage_state: Optional[Path] = None) -> BrowserContext:
+        """Create a browser context with the extraction viewport and request filtering"""
+        browser = await self._ensure_browser()
+        context = await browser.new_context(
+            viewport=VIEWPORT,
+            user_agent=USER_AGENT,
+            storage_state=str(storage_state) if storage_state else None
+        )
+        await context.route("**/*", self._route_request)
+        return context
+    
+    async def _acquire_context(self, storage_state: Optional[Path] = None) -> BrowserContext:
+        """Take a warm context from the pool, or create one if the pool is empty
+        
+        A site with saved cookies/localStorage gets a fresh context restored from them.
+        """
+        if storage_state and storage_state.exists():
+            try:
+                return await self._new_context(storage_state)
+            except Exception as e:
+                logger.warning(f"⚠️ Ignoring unreadable storage state {storage_state}: {e}")
+        try:
+            return self._context_pool.get_nowait()
+        except asyncio.QueueEmpty:
+            return await self._new_context()
+    
+    async def _release_context(self, context: BrowserContext):
+        """Close a used context and top the pool back up in the background"""
+        # Contexts are not reused across sites, so no cookies or storage leak between them
+        await context.close()
+        if self._context_pool.qsize() < self._pool_size:
+            task = asyncio.create_task(self._refill_pool())
+            self._pool_tasks.add(task)
+            task.add_done_callback(self._pool_tasks.discard)
     
-    async def _extract_assets(self, page: Page, site_dir: Path) -> List[Dict[str, str]]:
-        """Extract asset URLs"""
+    async def _refill_pool(self):
+        """Add one fresh context to the pool"""
+        try:
+            context = await self._new_context()
+        except Exception as e:
+            logger.debug(f"Failed to refill context pool: {e}")
+            return
+        if self._context_pool.qsize() < self._pool_size:
+            self._context_pool.put_nowait(context)
+        else:
+            await context.close()
+    
+    async def aclose(self):
+        """Close the shared browser and stop Playwright"""
+        self._pool_size = 0
+        for task in list(self._pool_tasks):
+            task.cancel()
+        await asyncio.gather(*self._pool_tasks, return_exceptions=True)
+        # Pooled contexts close with the browser
+        self._context_pool = asyncio.Queue()
+        async with self._browser_lock:
+            try:
+                if self._browser:
+                    await self._browser.close()
+                    logger.info("🔒 Browser closed")
+            finally:
+                if self._playwright:
+                    await self._playwright.stop()
+                self._browser = None
+                self._playwright = None
+        
+    async def extract_design(self, url: str, site_name: Optional[str] = None, force_refresh: bool = False) -> Dict[str, Any]:
+        """Main extraction method
+        
+        Unchanged pages (same URL, served HTML, viewport and output options) are
+        answered from the on-disk cache unless force_refresh is set, as long as
+        the screenshot, HTML and CSS coverage from that run are still on disk.
+        """
+        start_time = time.time()
+        
+        if not site_name:
+            site_name = urlparse(url).netloc.replace("www.", "")
+        
+        site_dir = self.output_dir / site_name
+        site_dir.mkdir(exist_ok=True)
+        
+        logger.info(f"🌐 Starting extraction for: {url}")
+        logger.info(f"📁 Output directory: {site_dir}")
+        
+        storage_state = site_dir / "storage_state.json"
+        context = await self._acquire_context(storage_state)
+        page = await context.new_page()
+        # Listen before navigating so assets are captured from the initial load
+        assets = self._track_assets(page)
+        
+        show_progress = not self._progress_active
+        self._progress_active = True
+        
+        try:
+            # A plain HTTP fetch is far cheaper than rendering; reuse results if the HTML is unchanged.
+            # A forced refresh never reads the cache, so it skips the fetch (and the cache write).
+            cache_file = None if force_refresh else await self._cache_path(context, url)
+            if cache_file:
+                cached = await asyncio.to_thread(self._read_cache, cache_file)
+                if cached is not None and await asyncio.to_thread(self._has_artifacts, cached, site_dir):
+                    logger.info(f"⚡ Using cached extraction for {url}")
+                    cached['site_name'] = site_name
+                    await self._save_results(cached, site_dir)
+                    return cached
+            
+            # Navigate and wait for content
+            logger.info(f"🚀 Navigating to {url}...")
+            await page.goto(url, wait_until='domcontentloaded', timeout=60000)
+            # Wait for the load event and web fonts instead of a fixed sleep, at most 5s each
+            try:
+                await page.wait_for_load_state('load', timeout=5000)
+            except PlaywrightTimeoutError:
+                logger.warning("⚠️ Timed out waiting for page load, continuing with current state")
+            try:
+                await page.wait_for_function(
+                    "document.fonts ? document.fonts.ready.then(() => true) : true",
+                    timeout=5000
+                )
+            except PlaywrightTimeoutError:
+                logger.warning("⚠️ Timed out waiting for web fonts, continuing with current state")
+            logger.info("✅ Page loaded successfully")
+            
+            # Extract all design tokens
+            with Progress(
+                SpinnerColumn(),
+                TextColumn("[progress.description]{task.description}"),
+                BarColumn(),
+                TaskProgressColumn(),
+                console=console,
+                disable=not show_progress
+            ) as progress:
+                
+                extraction_task = progress.add_task("Extracting design tokens...", total=6)
+                
+                logger.info("📸 Taking screenshot...")
+                screenshot = await self._take_screenshot(page, site_dir)
+                progress.update(extraction_task, advance=1)
+                
+                # Both only read the page, so they are pipelined over the same connection.
+                # The full-page screenshot above resizes the viewport, so it is not overlapped.
+                logger.info("📄 Extracting HTML, design tokens, breakpoints and animations...")
+                html, page_data = await asyncio.gather(
+                    self._extract_html(page, site_dir),
+                    self._extract_page_data(page)
+                )
+                progress.update(extraction_task, advance=2)
+                tokens = page_data['tokens']
+                breakpoints = page_data['breakpoints']
+                animations = page_data['animations']
+                
+                logger.info("🎨 Analyzing CSS coverage...")
+                css_coverage = await self._extract_css_coverage(page, site_dir)
+                progress.update(extraction_task, advance=1)
+                
+                logger.info("👆 Analyzing interactions...")
+                interactions = await self._extract_interactions(page, page_data['interactiveElements'])
+                progress.update(extraction_task, advance=1)
+                
+                logger.info(f"🗂️ Captured {len(assets)} asset requests")
+                if self.download_assets:
+                    await self._download_assets(assets, site_dir)
+                results = {
+                    'url': url,
+                    'site_name': site_name,
+                    'screenshot': screenshot,
+                    'html': html,
+                    'tokens': tokens,
+                    'css_coverage': css_coverage,
+                    'assets': assets,
+                    'responsive_breakpoints': breakpoints,
+                    'animations': animations,
+                    'interactions': interactions
+                }
+                
+                # Post-process tokens
+                logger.info("🔄 Processing tokens into design system...")
+                processed = self._process_tokens(results['tokens'], page_data['metrics'])
+                results.update(processed)
+                progress.update(extraction_task, advance=1)
+                
+                # Save results
+                logger.info("💾 Saving results...")
+                await self._save_results(results, site_dir)
+                if cache_file:
+                    await asyncio.to_thread(self._write_cache, cache_file, results)
+                # Cookies and localStorage are restored on the next run for this site
+                try:
+                    await context.storage_state(path=str(storage_state))
+                except Exception as e:
+                    logger.debug(f"Failed to save storage state: {e}")
+                
+                elapsed_time = time.time() - start_time
+                logger.info(f"✅ Extraction completed in {elapsed_time:.2f}s")
+                
+                return results
+            
+        finally:
+            if show_progress:
+                self._progress_active = False
+            await self._release_context(context)
+    
+    async def extract_many(self, urls: List[str], concurrency: Optional[int] = None) -> List[Any]:
+        """Extract several URLs concurrently on one shared browser
+        
+        Concurrency defaults to the number of CPU cores, capped at 8.
+        Returns one entry per URL in input order: the results dict, or the
+        exception raised while extracting that URL.
+        """
+        if concurrency is None:
+            concurrency = min(8, os.cpu_count() or 1)
+        semaphore = asyncio.Semaphore(concurrency)
+        await self.warmup(min(concurrency, len(urls)))
+        return await asyncio.gather(
+            *(self._extract_one(url, semaphore) for url in urls),
+            return_exceptions=True
+        )
+    
+    async def _extract_one(self, url: str, semaphore: asyncio.Semaphore) -> Dict[str, Any]:
+        """Run one extraction once a concurrency slot is free"""
+        async with semaphore:
+            return await self.extract_design(url)
+    
+    async def _cache_path(self, context, url: str) -> Optional[Path]:
+        """Fetch the raw HTML and return the cache file for it, the URL and the output options"""
+        try:
+            response = await context.request.get(url, timeout=CACHE_LOOKUP_TIMEOUT_MS)
+            body = await response.body()
+        except Exception as e:
+            logger.warning(f"⚠️ Could not fetch HTML for cache lookup: {e}")
+            return None
+        if not response.ok:
+            return None
+        # Pages sharing an app shell serve identical HTML, so the URL is part of the key
+        options = (url, VIEWPORT, self.screenshot_format, self.html_format, self.download_assets)
+        key = hashlib.blake2b(repr(options).encode() + b'\0' + body, digest_size=16).hexdigest()
+        return self._cache_dir / f"{key}.json"
+    
+    def _has_artifacts(self, cached: Dict[str, Any], site_dir: Path) -> bool:
+        """Check that the files a cached extraction points to still exist in site_dir"""
+        paths = [Path(cached['screenshot']), Path(cached['html'])]
+        if 'error' not in cached.get('css_coverage', {}):
+            paths.append(site_dir / "css_coverage.json")
+        if self.download_assets:
+            paths.extend(Path(asset['path']) for asset in cached.get('assets', []) if 'path' in asset)
+        return all(path.parent in (site_dir, site_dir / "assets") and path.is_file() for path in paths)
+    
+    @staticmethod
+    def _read_cache(cache_file: Path) -> Optional[Dict[str, Any]]:
+        """Load a cached extraction if it exists and has not expired, deleting it if it has"""
+        try:
+            if time.time() - cache_file.stat().st_mtime > CACHE_TTL_SECONDS:
+                cache_file.unlink(missing_ok=True)
+                return None
+            return orjson.loads(cache_file.read_bytes())
+        except (OSError, orjson.JSONDecodeError):
+            return None
+    
+    def _write_cache(self, cache_file: Path, results: Dict[str, Any]):
+        """Atomically store an extraction in the cache"""
+        self._cache_dir.mkdir(exist_ok=True)
+        tmp_file = cache_file.with_suffix(f'.{os.getpid()}.{id(results)}.tmp')
+        tmp_file.write_bytes(orjson.dumps(results, option=orjson.OPT_SERIALIZE_NUMPY))
+        os.replace(tmp_file, cache_file)
+        self._evict_cache()
+    
+    def _evict_cache(self):
+        """Delete the oldest cached extractions beyond CACHE_MAX_ENTRIES"""
+        entries = []
+        with os.scandir(self._cache_dir) as it:
+            for entry in it:
+                if entry.name.endswith('.json'):
+                    try:
+                        entries.append((entry.stat().st_mtime, entry.path))
+                    except OSError:
+                        pass
+        if len(entries) <= CACHE_MAX_ENTRIES:
+            return
+        entries.sort()
+        for _, path in entries[:len(entries) - CACHE_MAX_ENTRIES]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+    
+    @staticmethod
+    async def _route_request(route):
+        """Abort media, websockets and analytics/ad requests; let everything else through"""
+        request = route.request
+        if request.resource_type in BLOCKED_RESOURCE_TYPES or TRACKER_URL_RE.search(request.url):
+            await route.abort()
+        else:
+            await route.continue_()
+    
+    async def _take_screenshot(self, page: Page, site_dir: Path) -> str:
+        """Take full page screenshot, tiling very tall pages"""
+        is_jpeg = self.screenshot_format == 'jpeg'
+        screenshot_path = site_dir / ("screenshot.jpg" if is_jpeg else "screenshot.png")
+        options = {'type': 'jpeg', 'quality': SCREENSHOT_QUALITY} if is_jpeg else {'type': 'png'}
+        
+        height = await page.evaluate("document.documentElement.scrollHeight")
+        if height <= SCREENSHOT_MAX_FULL_PAGE_HEIGHT:
+            await page.screenshot(path=str(screenshot_path), full_page=True, **options)
+            return str(screenshot_path)
+        
+        # Capture fixed-height slices of the full page without scrolling
+        logger.info(f"📐 Page is {height}px tall, capturing in tiles")
+        width = page.viewport_size['width']
+        stitched_height = min(height, SCREENSHOT_MAX_STITCHED_HEIGHT)
+        tiles = []
+        for index, y in enumerate(range(0, height, SCREENSHOT_TILE_HEIGHT)):
+            clip = {'x': 0, 'y': y, 'width': width, 'height': min(SCREENSHOT_TILE_HEIGHT, height - y)}
+            if y < stitched_height:
+                tiles.append((y, await page.screenshot(type='png', full_page=True, clip=clip)))
+            else:
+                # Past the stitched height each tile is written on its own, never held in memory
+                tile_path = screenshot_path.with_name(f"{screenshot_path.stem}_{index}{screenshot_path.suffix}")
+                await page.screenshot(path=str(tile_path), full_page=True, clip=clip, **options)
+        if height > stitched_height:
+            logger.info(f"📐 Stitched the top {stitched_height}px, saved the rest as separate tiles")
+        
+        await asyncio.to_thread(self._stitch_tiles, tiles, stitched_height, screenshot_path, options)
+        return str(screenshot_path)
+    
+    @staticmethod
+    def _stitch_tiles(tiles: List[tuple], height: int, screenshot_path: Path, options: Dict[str, Any]):
+        """Paste viewport tiles into one image and encode it"""
+        first = Image.open(io.BytesIO(tiles[0][1]))
+        canvas = Image.new('RGB', (first.width, height))
+        for scroll_y, data in tiles:
+            canvas.paste(Image.open(io.BytesIO(data)).convert('RGB'), (0, scroll_y))
+        if options['type'] == 'jpeg':
+            canvas.save(screenshot_path, 'JPEG', quality=options['quality'])
+        else:
+            canvas.save(screenshot_path, 'PNG')
+    
+    async def _extract_html(self, page: Page, site_dir: Path) -> str:
+        """Extract rendered HTML, or a single-file MHTML snapshot when html_format is 'mhtml'"""
+        if self.html_format == 'mhtml':
+            html_path = site_dir / "page.mhtml"
+            client = await page.context.new_cdp_session(page)
+            try:
+                snapshot = await client.send('Page.captureSnapshot', {'format': 'mhtml'})
+            finally:
+                await client.detach()
+            await asyncio.to_thread(html_path.write_text, snapshot['data'], encoding='utf-8')
+            return str(html_path)
+        
+        html_path = site_dir / "page.html"
+        content = await page.content()
+        await asyncio.to_thread(html_path.write_text, content, encoding='utf-8')
+        return str(html_path)
+    
+    async def _extract_page_data(self, page: Page) -> Dict[str, Any]:
+        """Extract tokens, breakpoints, animations and interactive elements in one evaluate"""
+        logger.debug("🔍 Evaluating page JavaScript to extract design data...")
+        data = await page.evaluate(EXTRACT_PAGE_DATA_JS)
+        
+        # Resolve spacing palette indices; tokens share the palette's string objects
+        palette = data['metrics']['spacingPalette']
+        for token in data['tokens']:
+            spacing = token['spacing']
+            spacing['margin'] = [palette[i] for i in spacing['margin']]
+            spacing['padding'] = [palette[i] for i in spacing['padding']]
+        
+        logger.debug(f"📊 Extracted {len(data['tokens'])} design tokens from visible elements")
+        logger.debug(f"📱 Found {len(data['breakpoints'])} responsive breakpoints")
+        logger.debug(f"✨ Found {len(data['animations'].get('animations', []))} animations and {len(data['animations'].get('keyframes', []))} keyframes")
+        logger.debug(f"🎯 Found {len(data['interactiveElements'])} interactive elements")
+        return data
+    
+    def _track_assets(self, page: Page) -> List[Dict[str, str]]:
+        """Record font, stylesheet and image requests the page makes from now on"""
         assets = []
         
         def handle_request(request):
@@ -246,12 +767,56 @@ class DesignExtractor:
                 })
         
         page.on('request', handle_request)
-        logger.debug("🔄 Reloading page to capture asset requests...")
-        await page.reload(wait_until='networkidle')
-        
-        logger.debug(f"🗂️ Captured {len(assets)} asset requests")
         return assets
     
+    async def _download_assets(self, assets: List[Dict[str, str]], site_dir: Path) -> None:
+        """Download captured assets into site_dir/assets over shared HTTP/2 connections"""
+        assets_dir = site_dir / "assets"
+        assets_dir.mkdir(exist_ok=True)
+        
+        limits = httpx.Limits(
+            max_connections=ASSET_DOWNLOAD_CONNECTIONS,
+            max_keepalive_connections=ASSET_DOWNLOAD_CONNECTIONS
+        )
+        try:
+            client = httpx.AsyncClient(http2=True, limits=limits, follow_redirects=True, timeout=30)
+        except ImportError:
+            # HTTP/2 needs the h2 package (httpx[http2]); keep-alive HTTP/1.1 still pools connections
+            client = httpx.AsyncClient(limits=limits, follow_redirects=True, timeout=30)
+        
+        # Each URL is fetched once even if the page requested it several times
+        by_url = {asset['url']: asset for asset in assets if asset['url'].startswith(('http://', 'https://'))}
+        async with client:
+            # One failed asset must not abort the others or the extraction
+            fetched = await asyncio.gather(
+                *(self._fetch_asset(client, asset, assets_dir) for asset in by_url.values()),
+                return_exceptions=True
+            )
+        for asset, result in zip(by_url.values(), fetched):
+            if isinstance(result, Exception):
+                logger.debug(f"Failed to download {asset['url']}: {result}")
+        
+        downloaded = sum('path' in asset for asset in by_url.values())
+        logger.info(f"📦 Downloaded {downloaded}/{len(by_url)} assets to {assets_dir}")
+    
+    async def _fetch_asset(self, client, asset: Dict[str, str], assets_dir: Path):
+        """Fetch one asset and record where it was saved"""
+        try:
+            response = await client.get(asset['url'])
+            response.raise_for_status()
+        except (httpx.HTTPError, httpx.InvalidURL, ValueError) as e:
+            logger.debug(f"Failed to download {asset['url']}: {e}")
+            return
+        
+        name = hashlib.blake2b(asset['url'].encode(), digest_size=8).hexdigest()
+        asset_path = assets_dir / (name + Path(urlparse(asset['url']).path).suffix[:8])
+        try:
+            await asyncio.to_thread(asset_path.write_bytes, response.content)
+        except OSError as e:
+            logger.debug(f"Failed to save {asset['url']}: {e}")
+            return
+        asset['path'] = str(asset_path)
+    
     async def _extract_css_coverage(self, page: Page, site_dir: Path) -> Dict[str, Any]:
         """Extract CSS coverage data"""
         try:
@@ -265,41 +830,64 @@ class DesignExtractor:
             # Start CSS coverage tracking
             await client.send('CSS.startRuleUsageTracking')
             
-            # Wait for page to fully load and render
-            await page.wait_for_load_state('networkidle')
-            await page.wait_for_timeout(2000)
+            # Let late requests settle, but never wait on pages that keep polling
+            try:
+                await page.wait_for_load_state('networkidle', timeout=5000)
+            except PlaywrightTimeoutError:
+                logger.debug("Network did not go idle, continuing with coverage")
             
             # Trigger interactions to capture hover states and dynamic CSS
+            forced = []
             try:
-                # Scroll to trigger any scroll-based styles
-                await page.evaluate('window.scrollTo(0, document.body.scrollHeight / 2)')
-                await page.wait_for_timeout(500)
-                await page.evaluate('window.scrollTo(0, 0)')
-                await page.wait_for_timeout(500)
+                # Scroll to trigger any scroll-based styles, waiting for rendered frames instead of fixed sleeps
+                await page.evaluate("""async () => {
+                    const frame = () => new Promise(resolve => requestAnimationFrame(() => resolve()));
+                    window.scrollTo(0, document.body.scrollHeight / 2);
+                    await frame();
+                    await frame();
+                    window.scrollTo(0, 0);
+                    await frame();
+                    await frame();
+                }""")
                 
-                # Hover over interactive elements
-                buttons = await page.query_selector_all('button, a, .btn, [role="button"]')
-                for i, button in enumerate(buttons[:5]):  # Limit to first 5
-                    try:
-                        await button.hover()
-                        await page.wait_for_timeout(100)
-                    except:
-                        continue
+                # Force :hover/:focus on interactive elements; the commands are pipelined
+                # over the session instead of hovering and waiting on each element
+                document = await client.send('DOM.getDocument', {'depth': 0})
+                root_id = document['root']['nodeId']
+                hover_ids, focus_ids = await asyncio.gather(
+                    client.send('DOM.querySelectorAll', {'nodeId': root_id, 'selector': 'button, a, .btn, [role="button"]'}),
+                    client.send('DOM.querySelectorAll', {'nodeId': root_id, 'selector': 'input, textarea, select'})
+                )
+                forced = [(node_id, ['hover']) for node_id in hover_ids['nodeIds'][:20]]
+                forced += [(node_id, ['focus']) for node_id in focus_ids['nodeIds'][:10]]
+                await asyncio.gather(*(
+                    client.send('CSS.forcePseudoState', {'nodeId': node_id, 'forcedPseudoClasses': states})
+                    for node_id, states in forced
+                ))
                 
-                # Trigger any focus states
-                inputs = await page.query_selector_all('input, textarea, select')
-                for i, input_el in enumerate(inputs[:3]):  # Limit to first 3
-                    try:
-                        await input_el.focus()
-                        await page.wait_for_timeout(100)
-                    except:
-                        continue
+                # Fire the matching events for script-driven states and flush styles in one pass
+                await page.evaluate("""() => {
+                    document.querySelectorAll('button, a, .btn, [role="button"]').forEach((el, i) => {
+                        if (i < 20) {
+                            el.dispatchEvent(new MouseEvent('mouseover', {bubbles: true}));
+                            el.dispatchEvent(new MouseEvent('mouseenter'));
+                        }
+                    });
+                    document.querySelectorAll('input, textarea, select').forEach((el, i) => {
+                        if (i < 10) el.dispatchEvent(new FocusEvent('focusin', {bubbles: true}));
+                    });
+                    return document.body.offsetHeight;
+                }""")
                         
             except Exception as interaction_error:
                 print(f"Interaction simulation failed: {interaction_error}")
             
             # Stop coverage tracking and get results
             coverage = await client.send('CSS.stopRuleUsageTracking')
+            await asyncio.gather(*(
+                client.send('CSS.forcePseudoState', {'nodeId': node_id, 'forcedPseudoClasses': []})
+                for node_id, _ in forced
+            ), return_exceptions=True)
             
             # Process the coverage data to make it more useful
             processed_coverage = {
@@ -316,8 +904,9 @@ class DesignExtractor:
             
             # Save the processed coverage
             coverage_path = site_dir / "css_coverage.json"
-            with open(coverage_path, 'w') as f:
-                json.dump(processed_coverage, f, indent=2)
+            await asyncio.to_thread(
+                coverage_path.write_bytes, orjson.dumps(processed_coverage, option=orjson.OPT_INDENT_2)
+            )
             
             logger.info(f"📊 CSS Coverage: {processed_coverage['usedRules']}/{processed_coverage['totalRules']} rules used ({processed_coverage['coverage_percentage']}%)")
             
@@ -333,168 +922,142 @@ class DesignExtractor:
                 'error': str(e)
             }
     
-    async def _extract_breakpoints(self, page: Page) -> List[Dict[str, Any]]:
-        """Extract responsive breakpoints"""
-        breakpoints = await page.evaluate("""
-            () => {
-                const breakpoints = [];
-                for (const sheet of document.styleSheets) {
-                    try {
-                        for (const rule of sheet.cssRules) {
-                            if (rule.type === CSSRule.MEDIA_RULE) {
-                                const mediaText = rule.media.mediaText;
-                                const widthMatch = mediaText.match(/(?:min-width|max-width):\\s*(\\d+)px/g);
-                                if (widthMatch) {
-                                    breakpoints.push({
-                                        mediaText: mediaText,
-                                        widths: widthMatch
-                                    });
-                                }
-                            }
-                        }
-                    } catch (e) {
-                        // Skip external stylesheets due to CORS
-                    }
-                }
-                return breakpoints;
-            }
-        """)
-        logger.debug(f"📱 Found {len(breakpoints)} responsive breakpoints")
-        return breakpoints
-    
-    async def _extract_animations(self, page: Page) -> List[Dict[str, Any]]:
-        """Extract animations and transitions"""
-        animations = await page.evaluate("""
-            () => {
-                const animations = [];
-                const keyframes = [];
-                
-                // Extract @keyframes
-                for (const sheet of document.styleSheets) {
-                    try {
-                        for (const rule of sheet.cssRules) {
-                            if (rule.type === CSSRule.KEYFRAMES_RULE) {
-                                keyframes.push({
-                                    name: rule.name,
-                                    keyframes: Array.from(rule.cssRules).map(kr => ({
-                                        keyText: kr.keyText,
-                                        style: kr.style.cssText
-                                    }))
-                                });
-                            }
-                        }
-                    } catch (e) {
-                        // Skip external stylesheets
-                    }
-                }
-                
-                // Extract active animations
-                document.getAnimations().forEach(anim => {
-                    animations.push({
-                        animationName: anim.animationName,
-                        duration: anim.effect?.getTiming().duration,
-                        iterations: anim.effect?.getTiming().iterations,
-                        playState: anim.playState
-                    });
-                });
-                
-                return { animations, keyframes };
-            }
-        """)
-        logger.debug(f"✨ Found {len(animations.get('animations', []))} animations and {len(animations.get('keyframes', []))} keyframes")
-        return animations
-    
-    async def _extract_interactions(self, page: Page, site_dir: Path) -> Dict[str, Any]:
-        """Extract interaction states by simulating hover/focus"""
+    async def _extract_interactions(self, page: Page, interactive_elements: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Extract hover states by forcing :hover through CDP and reading all styles in one evaluate"""
         interactions = {}
+        targets = interactive_elements[:5]  # Limit to first 5
         
-        # Find interactive elements
-        interactive_elements = await page.evaluate("""
-            () => {
-                const selectors = ['button', 'a', 'input', '[role="button"]', '.btn'];
-                const elements = [];
-                
-                selectors.forEach(selector => {
-                    document.querySelectorAll(selector).forEach((el, i) => {
-                        const rect = el.getBoundingClientRect();
-                        if (rect.width > 0 && rect.height > 0) {
-                            elements.push({
-                                selector: selector,
-                                index: i,
-                                x: rect.x + rect.width / 2,
-                                y: rect.y + rect.height / 2,
-                                classes: el.className,
-                                tag: el.tagName.toLowerCase()
-                            });
-                        }
-                    });
-                });
-                
-                return elements.slice(0, 10); // Limit for performance
-            }
-        """)
-        
-        logger.debug(f"🎯 Found {len(interactive_elements)} interactive elements")
-        
-        # Capture hover states
         hover_states = []
-        for element in interactive_elements[:5]:  # Limit to first 5
-            try:
-                await page.mouse.move(element['x'], element['y'])
-                await page.wait_for_timeout(100)
-                
-                hover_style = await page.evaluate(f"""
-                    () => {{
-                        const el = document.querySelectorAll('{element["selector"]}')[{element["index"]}];
-                        if (el) {{
-                            const style = getComputedStyle(el);
-                            return {{
-                                backgroundColor: style.backgroundColor,
-                                color: style.color,
-                                transform: style.transform,
-                                boxShadow: style.boxShadow
-                            }};
-                        }}
-                        return null;
-                    }}
-                """)
-                
-                if hover_style:
-                    hover_states.append({
-                        'element': element,
-                        'hover_style': hover_style
-                    })
-            except Exception as e:
-                logger.debug(f"Failed to capture hover state: {e}")
+        client = None
+        try:
+            client = await page.context.new_cdp_session(page)
+            await client.send('DOM.enable')
+            await client.send('CSS.enable')
+            document = await client.send('DOM.getDocument', {'depth': 0})
+            root_id = document['root']['nodeId']
+            
+            # Force :hover on each target instead of moving the mouse and waiting
+            node_ids = {}
+            forced = []
+            for element in targets:
+                selector = element['selector']
+                if selector not in node_ids:
+                    result = await client.send('DOM.querySelectorAll', {'nodeId': root_id, 'selector': selector})
+                    node_ids[selector] = result['nodeIds']
+                if element['index'] < len(node_ids[selector]):
+                    node_id = node_ids[selector][element['index']]
+                    await client.send('CSS.forcePseudoState', {'nodeId': node_id, 'forcedPseudoClasses': ['hover']})
+                    forced.append(node_id)
+            
+            # Read every hovered style at once; transitions are suspended so final values are reported
+            hover_styles = await page.evaluate("""
+                (targets) => targets.map(({selector, index}) => {
+                    const el = document.querySelectorAll(selector)[index];
+                    if (!el) return null;
+                    const transition = el.style.transition;
+                    el.style.transition = 'none';
+                    const style = getComputedStyle(el);
+                    const hoverStyle = {
+                        backgroundColor: style.backgroundColor,
+                        color: style.color,
+                        transform: style.transform,
+                        boxShadow: style.boxShadow
+                    };
+                    el.style.transition = transition;
+                    return hoverStyle;
+                })
+            """, [{'selector': e['selector'], 'index': e['index']} for e in targets])
+            
+            for node_id in forced:
+                await client.send('CSS.forcePseudoState', {'nodeId': node_id, 'forcedPseudoClasses': []})
+            
+            hover_states = [
+                {'element': element, 'hover_style': hover_style}
+                for element, hover_style in zip(targets, hover_styles)
+                if hover_style
+            ]
+        except Exception as e:
+            logger.debug(f"Failed to capture hover states: {e}")
+        finally:
+            if client:
+                await client.detach()
         
         interactions['hover_states'] = hover_states
         logger.debug(f"👆 Captured {len(hover_states)} hover states")
         return interactions
     
-    def _process_tokens(self, tokens: List[Dict[str, Any]]) -> Dict[str, Any]:
-        """Process and cluster tokens into design system"""
+    def _process_tokens(self, tokens: List[Dict[str, Any]], metrics: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Process and cluster tokens into design system
+        
+        ``metrics`` holds values the page already parsed (``spacingPx`` and
+        ``colorRgb``); without it they are parsed from the token strings.
+        """
         if not tokens:
             logger.warning("⚠️ No tokens to process")
             return {}
         
         logger.debug(f"🔄 Processing {len(tokens)} tokens into design system...")
         
-        # Extract and cluster colors
-        colors = self._extract_colors(tokens)
-        color_palette = self._cluster_colors(colors)
+        # Gather colors, fonts, spacing and components in a single pass over the tokens.
+        # Each token stands for `count` elements sharing its style, so frequencies are weighted by it.
+        colors: Dict[str, int] = {}  # insertion-ordered, with element counts
+        fonts = []
+        font_counts = []
+        spacing_values = []  # raw margin/padding strings, parsed together later
+        components = {component_type: [] for component_type in COMPONENT_PATTERNS}
+        unfilled = dict(COMPONENT_PATTERNS)  # component types still collecting examples
+        
+        for token in tokens:
+            count = token.get('count', 1)
+            token_colors = token.get('colors')
+            if token_colors:
+                for color_value in token_colors.values():
+                    if color_value and color_value != 'rgba(0, 0, 0, 0)':
+                        colors[color_value] = colors.get(color_value, 0) + count
+            
+            typography = token.get('typography')
+            if typography:
+                fonts.append(typography)
+                font_counts.append(count)
+            
+            spacing = token.get('spacing')
+            if spacing and metrics is None:
+                for space_type in ('margin', 'padding'):
+                    space_values = spacing.get(space_type)
+                    if space_values:
+                        spacing_values.extend(space_values)
+            
+            if not unfilled:
+                continue
+            classes = str(token.get('classes', '')).lower()
+            tag = token.get('tag')
+            for component_type, patterns in list(unfilled.items()):
+                if tag in patterns or any(pattern in classes for pattern in patterns):
+                    examples = components[component_type]
+                    examples.append(token)
+                    if len(examples) >= COMPONENT_EXAMPLE_LIMIT:
+                        del unfilled[component_type]
+        
+        # Cluster colors
+        color_palette = self._cluster_colors(
+            list(colors), rgb_lookup=metrics and metrics['colorRgb'], weights=list(colors.values())
+        )
         logger.debug(f"🎨 Found {len(colors)} unique colors, clustered into {len(color_palette.get('primary_colors', []))} primary colors")
         
-        # Extract and cluster fonts
-        fonts = self._extract_fonts(tokens)
-        font_system = self._cluster_fonts(fonts)
+        # Cluster fonts
+        font_system = self._cluster_fonts(fonts, font_counts)
         logger.debug(f"📝 Found {len(fonts)} font instances, {len(font_system.get('primary_fonts', []))} primary fonts")
         
-        # Extract spacing scale
-        spacing_scale = self._extract_spacing_scale(tokens)
+        # Build spacing scale
+        if metrics is None:
+            spacing_px = self._parse_px_values(spacing_values)
+        else:
+            spacing_px = np.asarray(metrics['spacingPx'], dtype=np.int64)
+        spacing_scale = self._build_spacing_scale(spacing_px)
         logger.debug(f"📏 Generated spacing scale with {len(spacing_scale)} values")
         
-        # Extract component patterns
-        components = self._extract_components(tokens)
+        # Keep only component categories with examples
+        components = {component_type: examples for component_type, examples in components.items() if examples}
         component_count = sum(len(comp_list) for comp_list in components.values())
         logger.debug(f"🧩 Identified {component_count} components across {len(components)} categories")
         
@@ -505,102 +1068,150 @@ class DesignExtractor:
             'components': components
         }
     
-    def _extract_colors(self, tokens: List[Dict[str, Any]]) -> List[str]:
-        """Extract all unique colors from tokens"""
-        colors = set()
-        for token in tokens:
-            if token.get('colors'):
-                for color_value in token['colors'].values():
-                    if color_value and color_value != 'rgba(0, 0, 0, 0)':
-                        colors.add(color_value)
-        return list(colors)
-    
-    def _cluster_colors(self, colors: List[str], max_colors: int = 10) -> Dict[str, Any]:
-        """Cluster colors into a palette"""
+    def _cluster_colors(
+        self,
+        colors: List[str],
+        max_colors: int = 10,
+        rgb_lookup: Optional[Dict[str, Optional[List[int]]]] = None,
+        weights: Optional[List[int]] = None
+    ) -> Dict[str, Any]:
+        """Cluster colors into a palette, using pre-parsed RGB values from rgb_lookup when given
+        
+        ``weights`` holds how many elements use each color (1 each when omitted).
+        """
         if not colors:
             return {}
         
-        # Convert colors to RGB
-        rgb_colors = []
-        for color in colors:
-            rgb = self._color_to_rgb(color)
-            if rgb:
-                rgb_colors.append(rgb)
+        # Convert colors to an (N, 3) RGB array
+        to_rgb = rgb_lookup.get if rgb_lookup is not None else self._color_to_rgb
+        rgb, parsed = self._colors_to_rgb_array(colors, to_rgb)
+        weights = np.ones(len(rgb)) if weights is None else np.asarray(weights, dtype=np.float64)[parsed]
         
-        if len(rgb_colors) < 2:
+        if len(rgb) < 2:
             return {'primary_colors': colors}
         
-        # Cluster colors
-        n_clusters = min(max_colors, len(rgb_colors))
-        kmeans = KMeans(n_clusters=n_clusters, random_state=42)
-        clusters = kmeans.fit_predict(rgb_colors)
-        
-        # Get representative colors
-        palette = []
-        for i in range(n_clusters):
-            cluster_colors = [rgb_colors[j] for j, c in enumerate(clusters) if c == i]
-            if cluster_colors:
-                # Use the most common color in cluster
-                representative = Counter(map(tuple, cluster_colors)).most_common(1)[0][0]
-                palette.append(f"rgb({representative[0]}, {representative[1]}, {representative[2]})")
+        packed = (rgb[:, 0].astype(np.uint32) << 16) | (rgb[:, 1].astype(np.uint32) << 8) | rgb[:, 2]
+        unique_colors, color_index = np.unique(packed, return_inverse=True)
+        
+        if len(unique_colors) <= max(max_colors, SMALL_PALETTE_SIZE):
+            # Too few colors for clustering to help; keep them all
+            representatives = unique_colors
+        else:
+            # Cluster colors
+            clusters, n_clusters = self._quantize_colors(rgb, max_colors, weights)
+            
+            # Use the most used color in each cluster: count every (cluster, color)
+            # pair at once on colors packed into a single integer
+            counts = np.bincount(
+                clusters * len(unique_colors) + color_index.ravel(),
+                weights=weights,
+                minlength=n_clusters * len(unique_colors)
+            ).reshape(n_clusters, len(unique_colors))
+            representatives = unique_colors[counts.argmax(axis=1)[counts.any(axis=1)]]
+        
+        # Order the palette by hue, then saturation and brightness
+        channels = [(int(c) >> 16, (int(c) >> 8) & 0xFF, int(c) & 0xFF) for c in representatives]
+        channels.sort(key=lambda c: colorsys.rgb_to_hsv(c[0] / 255, c[1] / 255, c[2] / 255))
+        palette = [f"rgb({r}, {g}, {b})" for r, g, b in channels]
         
         return {
             'primary_colors': palette,
             'all_colors': colors[:20]  # Limit for readability
         }
     
-    def _color_to_rgb(self, color: str) -> Optional[tuple]:
-        """Convert color string to RGB tuple"""
+    @staticmethod
+    def _quantize_colors(rgb: np.ndarray, max_colors: int, weights: np.ndarray) -> Tuple[np.ndarray, int]:
+        """Assign each color to a cluster, Wu-style: histogram first, then weighted k-means
+        
+        Colors are binned to 4 bits per channel and k-means runs on the occupied
+        bins' mean colors, weighted by bin population (the summed color weights)
+        and seeded with the most populated bins, so the result is deterministic.
+        Returns the per-color cluster labels and the number of clusters.
+        """
+        bins = (rgb >> 4).astype(np.int32)
+        keys = (bins[:, 0] << 8) | (bins[:, 1] << 4) | bins[:, 2]
+        unique_bins, bin_index = np.unique(keys, return_inverse=True)
+        bin_index = bin_index.ravel()
+        bin_counts = np.bincount(bin_index, weights=weights, minlength=len(unique_bins))
+        
+        means = np.stack([
+            np.bincount(bin_index, weights=rgb[:, channel] * weights, minlength=len(unique_bins))
+            for channel in range(3)
+        ], axis=1) / bin_counts[:, None]
+        
+        n_clusters = min(max_colors, len(unique_bins))
+        init = means[np.argsort(-bin_counts, kind='stable')[:n_clusters]]
+        kmeans = MiniBatchKMeans(
+            n_clusters=n_clusters, init=init, n_init=1,
+            batch_size=min(256, len(means)), max_iter=50, random_state=42
+        )
+        # One BLAS/OpenMP thread per fit; concurrent extractions would otherwise oversubscribe the CPU
+        with threadpool_limits(1):
+            kmeans.fit(means, sample_weight=bin_counts)
+        return kmeans.labels_[bin_index], n_clusters
+    
+    @staticmethod
+    def _colors_to_rgb_array(colors: List[str], to_rgb) -> Tuple[np.ndarray, np.ndarray]:
+        """Fill an (N, 3) uint8 array with the colors that parse, skipping the rest
+        
+        Also returns the indices in ``colors`` of the rows that were kept.
+        """
+        rgb = np.empty((len(colors), 3), dtype=np.uint8)
+        parsed = np.empty(len(colors), dtype=np.intp)
+        n = 0
+        for i, color in enumerate(colors):
+            value = to_rgb(color)
+            if value:
+                rgb[n] = value
+                parsed[n] = i
+                n += 1
+        return rgb[:n], parsed[:n]
+    
+    @staticmethod
+    @functools.lru_cache(maxsize=4096)
+    def _color_to_rgb(color: str) -> Optional[tuple]:
+        """Convert color string to RGB tuple (memoized; the same strings recur across pages)"""
+        if not color:
+            return None
         try:
-            # Handle rgb() format
-            if color.startswith('rgb('):
-                values = re.findall(r'\d+', color)
-                if len(values) >= 3:
-                    return (int(values[0]), int(values[1]), int(values[2]))
-            
-            # Handle rgba() format
-            elif color.startswith('rgba('):
-                values = re.findall(r'[\d.]+', color)
+            # Handle rgb() and rgba() formats
+            match = _RGB_RE.match(color) if color[0] == 'r' else None
+            if match:
+                values = _NUMBER_RE.findall(match.group(1))
                 if len(values) >= 3:
                     return (int(float(values[0])), int(float(values[1])), int(float(values[2])))
+                return None
             
             # Handle hex format
-            elif color.startswith('#'):
-                color = color[1:]
-                if len(color) == 6:
-                    return (int(color[0:2], 16), int(color[2:4], 16), int(color[4:6], 16))
-                elif len(color) == 3:
-                    return (int(color[0]*2, 16), int(color[1]*2, 16), int(color[2]*2, 16))
-        
-        except Exception:
+            match = _HEX_RE.fullmatch(color) if color[0] == '#' else None
+            if match:
+                hex_value = match.group(1)
+                if len(hex_value) == 3:
+                    hex_value = ''.join(c * 2 for c in hex_value)
+                return (int(hex_value[0:2], 16), int(hex_value[2:4], 16), int(hex_value[4:6], 16))
+        
+        except ValueError:
             pass
         
         return None
     
-    def _extract_fonts(self, tokens: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        """Extract font information"""
-        fonts = []
-        for token in tokens:
-            if token.get('typography'):
-                fonts.append(token['typography'])
-        return fonts
-    
-    def _cluster_fonts(self, fonts: List[Dict[str, Any]]) -> Dict[str, Any]:
-        """Cluster fonts into typography system"""
+    def _cluster_fonts(self, fonts: List[Dict[str, Any]], counts: Optional[List[int]] = None) -> Dict[str, Any]:
+        """Cluster fonts into typography system
+        
+        ``counts`` holds how many elements use each font style (1 each when omitted).
+        """
         if not fonts:
             return {}
         
-        # Group by font family
+        # Count uses of each font family
         font_families = {}
         font_sizes = []
         font_weights = []
         
-        for font in fonts:
+        for font, count in zip(fonts, counts or [1] * len(fonts)):
             family = font.get('fontFamily', '').split(',')[0].strip().strip('"\'')
             if family:
-                if family not in font_families:
-                    font_families[family] = []
-                font_families[family].append(font)
+                font_families[family] = font_families.get(family, 0) + count
             
             # Collect sizes and weights
             size = font.get('fontSize', '')
@@ -615,73 +1226,44 @@ class DesignExtractor:
                 font_weights.append(int(weight))
         
         # Get most common families
-        primary_fonts = sorted(font_families.items(), key=lambda x: len(x[1]), reverse=True)[:3]
+        primary_fonts = list(font_families)
+        if len(primary_fonts) > 1:
+            primary_fonts = sorted(primary_fonts, key=font_families.get, reverse=True)[:3]
         
         # Get unique sizes and weights
         unique_sizes = sorted(set(font_sizes))
         unique_weights = sorted(set(font_weights))
         
         return {
-            'primary_fonts': [family for family, _ in primary_fonts],
+            'primary_fonts': primary_fonts,
             'font_sizes': unique_sizes,
             'font_weights': unique_weights
         }
     
-    def _extract_spacing_scale(self, tokens: List[Dict[str, Any]]) -> List[int]:
-        """Extract spacing scale from margins and padding"""
-        spacing_values = []
+    def _parse_px_values(self, spacing_values: List[str]) -> np.ndarray:
+        """Parse raw margin/padding values such as '16px' into integer pixels"""
+        px_values = [value for value in spacing_values if value and value.endswith('px')]
+        if not px_values:
+            return np.empty(0, dtype=np.int64)
         
-        for token in tokens:
-            if token.get('spacing'):
-                for space_type in ['margin', 'padding']:
-                    if token['spacing'].get(space_type):
-                        for value in token['spacing'][space_type]:
-                            if value and 'px' in value:
-                                try:
-                                    px_value = int(float(value.replace('px', '')))
-                                    if px_value > 0:
-                                        spacing_values.append(px_value)
-                                except ValueError:
-                                    pass
-        
-        # Get unique values and sort
-        unique_values = sorted(set(spacing_values))
+        # Parse the whole column at once
+        try:
+            return np.char.rstrip(np.asarray(px_values), 'px').astype(np.float64).astype(np.int64)
+        except ValueError:
+            return np.fromiter(
+                (int(float(v[:-2])) for v in px_values if v[:-2].replace('.', '', 1).lstrip('-').isdigit()),
+                dtype=np.int64
+            )
+    
+    def _build_spacing_scale(self, values: np.ndarray) -> List[int]:
+        """Build a spacing scale from margin/padding pixel values"""
+        # Keep unique positive values
+        values = np.unique(values[values > 0])
         
         # Filter to common design system values
-        scale = []
-        for value in unique_values:
-            if value <= 100 and (value % 4 == 0 or value % 8 == 0 or value in [2, 6, 10, 12, 14, 18, 20, 24, 28, 36, 44, 48, 52, 56, 60, 64, 72, 80, 96]):
-                scale.append(value)
-        
-        return scale[:20]  # Limit for readability
-    
-    def _extract_components(self, tokens: List[Dict[str, Any]]) -> Dict[str, Any]:
-        """Extract component patterns"""
-        components = {}
-        
-        # Group by common component classes
-        component_patterns = {
-            'buttons': ['button', 'btn', 'cta'],
-            'cards': ['card', 'item', 'post'],
-            'headers': ['header', 'nav', 'navigation'],
-            'footers': ['footer']
-        }
-        
-        for component_type, patterns in component_patterns.items():
-            matching_tokens = []
-            for token in tokens:
-                classes = token.get('classes', '')
-                if isinstance(classes, str):
-                    classes = classes.lower()
-                else:
-                    classes = str(classes).lower()
-                if any(pattern in classes for pattern in patterns) or token.get('tag') in patterns:
-                    matching_tokens.append(token)
-            
-            if matching_tokens:
-                components[component_type] = matching_tokens[:5]  # Limit examples
+        mask = (values <= 100) & ((values % 4 == 0) | np.isin(values, _SPECIAL_SPACING_ARRAY, assume_unique=True))
         
-        return components
+        return values[mask][:20].tolist()  # Limit for readability
     
     async def _save_results(self, results: Dict[str, Any], site_dir: Path):
         """Save extraction results"""
@@ -700,19 +1282,20 @@ class DesignExtractor:
             'asset_count': len(results.get('assets', []))
         }
         
-        with open(results_path, 'w') as f:
-            json.dump(simplified_results, f, indent=2)
+        await asyncio.to_thread(
+            results_path.write_bytes,
+            orjson.dumps(simplified_results, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY)
+        )
         
         logger.info(f"✅ Design tokens saved to: {results_path}")
 
 
 async def main():
     """Example usage"""
-    extractor = DesignExtractor()
-    
-    # Test with a single URL
-    url = "https://bryce-hall.com/"
-    results = await extractor.extract_design(url)
+    async with DesignExtractor() as extractor:
+        # Test with a single URL
+        url = "https://bryce-hall.com/"
+        results = await extractor.extract_design(url)
     
     logger.info(f"🎯 Extraction Summary for: {url}")
     logger.info(f"   🎨 {len(results.get('color_palette', {}).get('primary_colors', []))} primary colors")
@@ -4,15 +4,27 @@ HTML Style Extraction using Google Gemini 2.5 Pro
 Processes HTML files and extracts detailed style information for recreation.
 """
 
+import asyncio
+import functools
+import hashlib
+import html
+import io
 import os
+import random
+import re
 import sys
 import time
 import logging
+from html.parser import HTMLParser
 from pathlib import Path
-from PIL import Image
 from google import genai
+from google.genai import errors, types
 from google.genai.types import HttpOptions
 
+import orjson
+
+import cache
+
 # Setup logging
 logging.basicConfig(
     level=logging.INFO,
@@ -24,8 +36,188 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def setup_gemini_client():
-    """Initialize the Gemini client with API key from environment variable."""
+GEMINI_MODEL = "gemini-2.5-pro"
+# Bump when the prompt changes so cached responses are not reused for it
+PROMPT_VERSION = "v2"
+# Request quota for GEMINI_MODEL; requests are paced to stay within it
+REQUESTS_PER_MINUTE = 5
+# Requests allowed in flight at once
+MAX_CONCURRENT_REQUESTS = 4
+# Throttled (429) and overloaded (503) requests are retried with backoff
+RETRYABLE_STATUS_CODES = {429, 503}
+MAX_ATTEMPTS = 8
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 60.0
+# Seconds between status checks on a submitted batch job
+BATCH_POLL_INTERVAL = 30
+# Inline batch requests are capped at 20 MB per job; requests are split across jobs below this
+BATCH_MAX_INLINE_BYTES = 18 * 1024 * 1024
+BATCH_DONE_STATES = {
+    types.JobState.JOB_STATE_SUCCEEDED,
+    types.JobState.JOB_STATE_PARTIALLY_SUCCEEDED,
+    types.JobState.JOB_STATE_FAILED,
+    types.JobState.JOB_STATE_CANCELLED,
+    types.JobState.JOB_STATE_EXPIRED,
+}
+SCREENSHOT_MIME_TYPES = {".jpg": "image/jpeg", ".png": "image/png"}
+# Screenshot file names in order of preference
+SCREENSHOT_NAMES = ("screenshot.jpg", "screenshot.png")
+# Screenshots uploaded through the Files API, keyed by content hash, so reruns reuse them
+UPLOADS_MANIFEST = Path(__file__).parent / "uploads.json"
+# Uploaded files expire after 48 hours; upload again once less than this many seconds remain
+UPLOAD_EXPIRY_MARGIN = 3600
+UPLOAD_LIFETIME = 48 * 3600
+
+# Elements whose contents say nothing about the page's style; dropped from the prompt
+DROPPED_TAGS = {"script", "noscript", "template"}
+_WHITESPACE_RE = re.compile(r'\s+')
+_CSS_DATA_URI_RE = re.compile(r'url\(\s*[\'"]?data:[^)]*\)', re.IGNORECASE)
+# Characters of HTML read and fed to the stripper at a time
+HTML_READ_CHUNK_SIZE = 1 << 16
+
+class PromptHTMLStripper(HTMLParser):
+    """Re-serialize HTML without scripts, comments, data URIs or redundant whitespace."""
+    
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        self.parts = []
+        self._skip_depth = 0
+        # Text arrives in pieces when the page is fed in chunks; it is buffered until the next markup
+        self._text = []
+    
+    def _format_tag(self, tag, attrs, closing):
+        formatted = [tag]
+        for name, value in attrs:
+            if value is None:
+                formatted.append(name)
+                continue
+            if value.lstrip()[:5].lower() == "data:":
+                value = ""
+            elif name == "style":
+                value = _CSS_DATA_URI_RE.sub("url()", value)
+            formatted.append(f'{name}="{html.escape(value)}"')
+        return f"<{' '.join(formatted)}{closing}>"
+    
+    def _flush_text(self):
+        if self._text:
+            data = "".join(self._text)
+            self._text.clear()
+            if not data.isspace():
+                self.parts.append(_CSS_DATA_URI_RE.sub("url()", _WHITESPACE_RE.sub(" ", data)))
+    
+    def handle_starttag(self, tag, attrs):
+        self._flush_text()
+        if tag in DROPPED_TAGS:
+            self._skip_depth += 1
+        elif not self._skip_depth:
+            self.parts.append(self._format_tag(tag, attrs, ""))
+    
+    def handle_startendtag(self, tag, attrs):
+        self._flush_text()
+        if not self._skip_depth and tag not in DROPPED_TAGS:
+            self.parts.append(self._format_tag(tag, attrs, " /"))
+    
+    def handle_endtag(self, tag):
+        self._flush_text()
+        if tag in DROPPED_TAGS:
+            self._skip_depth = max(0, self._skip_depth - 1)
+        elif not self._skip_depth:
+            self.parts.append(f"</{tag}>")
+    
+    def handle_data(self, data):
+        if not self._skip_depth:
+            self._text.append(data)
+    
+    def handle_entityref(self, name):
+        self._flush_text()
+        if not self._skip_depth:
+            self.parts.append(f"&{name};")
+    
+    def handle_charref(self, name):
+        self._flush_text()
+        if not self._skip_depth:
+            self.parts.append(f"&#{name};")
+    
+    def handle_decl(self, decl):
+        self._flush_text()
+        self.parts.append(f"<!{decl}>")
+    
+    def close(self):
+        super().close()
+        self._flush_text()
+
+def strip_html_file(html_file):
+    """Shrink an HTML file to the markup and CSS that describe the page's style.
+    
+    The file is streamed through the parser so the raw page is never held whole.
+    """
+    stripper = PromptHTMLStripper()
+    with open(html_file, 'r', encoding='utf-8') as f:
+        while chunk := f.read(HTML_READ_CHUNK_SIZE):
+            stripper.feed(chunk)
+    stripper.close()
+    return "".join(stripper.parts)
+
+class RateLimiter:
+    """Token bucket allowing `rate` requests per `per` seconds, bursting up to `rate`."""
+    
+    def __init__(self, rate, per=60.0):
+        self.rate = rate
+        self.per = per
+        self._tokens = float(rate)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+    
+    async def __aenter__(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.rate, self._tokens + (now - self._updated) * self.rate / self.per)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return self
+                await asyncio.sleep((1 - self._tokens) * self.per / self.rate)
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        return False
+
+class ResultWriter:
+    """Save results from a background task so domains never wait on the disk."""
+    
+    def __init__(self):
+        self.failed = set()
+        self._queue = asyncio.Queue()
+        self._task = None
+    
+    def put(self, output_path, content):
+        """Queue content to be written to output_path."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._drain())
+        self._queue.put_nowait((output_path, content))
+    
+    async def _drain(self):
+        while True:
+            output_path, content = await self._queue.get()
+            try:
+                if await asyncio.to_thread(save_result, output_path, content):
+                    logger.info(f"✓ Saved style analysis to {output_path}")
+                else:
+                    self.failed.add(output_path)
+                    logger.error(f"✗ Failed to save {output_path}")
+            finally:
+                self._queue.task_done()
+    
+    async def aclose(self):
+        """Wait for queued writes to land, then stop the background task."""
+        if self._task is None:
+            return
+        await self._queue.join()
+        self._task.cancel()
+
+@functools.lru_cache(maxsize=1)
+def get_client():
+    """Return the shared Gemini client, created on first use with the API key from the environment."""
     logger.info("Setting up Gemini client")
     api_key = os.getenv('GEMINI_API_KEY')
     if not api_key:
@@ -41,59 +233,354 @@ def setup_gemini_client():
         logger.error(f"Error initializing Gemini client: {e}")
         sys.exit(1)
 
-def read_html_file(file_path):
-    """Read HTML file content."""
-    logger.debug(f"Reading HTML file: {file_path}")
+def find_screenshot(folder):
+    """Return the folder's screenshot (JPEG or PNG), or None if there is none."""
+    for name in SCREENSHOT_NAMES:
+        screenshot_file = folder / name
+        if screenshot_file.exists():
+            return screenshot_file
+    return None
+
+_uploads = None
+_uploads_lock = None
+
+async def load_uploads():
+    """Return the manifest of uploaded screenshots, loading it on first use."""
+    global _uploads, _uploads_lock
+    if _uploads is None:
+        try:
+            loaded = orjson.loads(await asyncio.to_thread(UPLOADS_MANIFEST.read_bytes))
+        except (OSError, orjson.JSONDecodeError):
+            loaded = {}
+        # Another upload may have loaded it while this read was in flight
+        if _uploads is None:
+            _uploads = loaded
+            _uploads_lock = asyncio.Lock()
+    return _uploads
+
+def write_manifest(data):
+    """Replace the uploads manifest with data, so a crash mid-write never leaves it truncated."""
+    tmp_path = UPLOADS_MANIFEST.with_suffix(".json.tmp")
+    tmp_path.write_bytes(data)
+    os.replace(tmp_path, UPLOADS_MANIFEST)
+
+async def save_uploads():
+    """Write the current manifest of uploaded screenshots off the event loop."""
+    async with _uploads_lock:
+        # Serialize on the loop so the thread never sees the dict change mid-dump
+        await asyncio.to_thread(write_manifest, orjson.dumps(_uploads, option=orjson.OPT_INDENT_2))
+
+async def get_screenshot_part(client, screenshot_path, screenshot_bytes):
+    """Return the screenshot as a Files API reference, uploading it only when no live copy exists."""
+    mime_type = SCREENSHOT_MIME_TYPES[screenshot_path.suffix]
+    digest = hashlib.sha256(screenshot_bytes).hexdigest()
+    uploads = await load_uploads()
+    entry = uploads.get(digest)
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-            logger.debug(f"Successfully read {len(content)} characters from {file_path}")
-            return content
+        if entry and entry["expires_at"] > time.time() + UPLOAD_EXPIRY_MARGIN:
+            try:
+                uploaded = await client.aio.files.get(name=entry["name"])
+                logger.debug(f"Reusing uploaded screenshot {uploaded.name} for {screenshot_path}")
+                return types.Part.from_uri(file_uri=uploaded.uri, mime_type=mime_type)
+            except Exception as e:
+                logger.debug(f"Uploaded screenshot {entry['name']} is no longer available: {e}")
+        
+        # Upload the encoded screenshot as-is; decoding it first would only be re-encoded
+        uploaded = await client.aio.files.upload(
+            file=io.BytesIO(screenshot_bytes),
+            config={"mime_type": mime_type, "display_name": screenshot_path.parent.name}
+        )
+        expires_at = uploaded.expiration_time.timestamp() if uploaded.expiration_time else time.time() + UPLOAD_LIFETIME
+        uploads[digest] = {"name": uploaded.name, "expires_at": expires_at}
+        await save_uploads()
+        logger.debug(f"Uploaded screenshot {screenshot_path} as {uploaded.name}")
+        return types.Part.from_uri(file_uri=uploaded.uri, mime_type=mime_type)
     except Exception as e:
-        logger.error(f"Error reading file {file_path}: {e}")
-        return None
+        logger.warning(f"Could not upload {screenshot_path}, sending it inline: {e}")
+        return types.Part.from_bytes(data=screenshot_bytes, mime_type=mime_type)
 
-def extract_style_with_gemini(client, html_content, screenshot_path):
-    """Extract style information using Gemini 2.5 Pro with both HTML and screenshot."""
-    logger.info(f"Extracting style with Gemini using screenshot: {screenshot_path}")
+def build_style_contents(html_content, image_part):
+    """Build the screenshot and prompt parts of a style extraction request."""
     prompt = f"""Extract the style of this html, use lots of design language to describe it's aesthetic, layout, fonts, interaction, etc. Have so much design detail and technical detail that anyone can recreate this well designed website:
 
 {html_content}
 """
+    return [image_part, types.Part.from_text(text=prompt)]
+
+def retry_delay(error, attempt):
+    """Return the retry delay the server asked for, or an exponential backoff with jitter."""
+    details = error.details.get("error", {}).get("details", []) if isinstance(error.details, dict) else []
+    for detail in details:
+        if detail.get("@type", "").endswith("google.rpc.RetryInfo"):
+            try:
+                # Durations are encoded as seconds with an "s" suffix, e.g. "41s" or "0.5s"
+                return float(detail.get("retryDelay", "").rstrip("s"))
+            except ValueError:
+                break
+    return random.uniform(0.5, 1.0) * min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt)
+
+async def stream_style_response(client, contents, part_path):
+    """Stream a response into part_path and return its full text."""
+    chunks = []
+    # File operations run on a worker thread so the event loop never waits on the disk
+    f = await asyncio.to_thread(open, part_path, 'w', encoding='utf-8')
+    try:
+        async for chunk in await client.aio.models.generate_content_stream(
+            model=GEMINI_MODEL,
+            contents=contents,
+        ):
+            if chunk.text:
+                await asyncio.to_thread(f.write, chunk.text)
+                chunks.append(chunk.text)
+    finally:
+        await asyncio.to_thread(f.close)
+    return "".join(chunks)
+
+async def extract_style_with_gemini(client, html_content, screenshot_path, screenshot_bytes, output_path, limiter):
+    """Extract style information using Gemini 2.5 Pro with both HTML and screenshot, streaming it to output_path.
+    
+    Every attempt, retries included, takes a token from limiter.
+    """
+    logger.info(f"Extracting style with Gemini using screenshot: {screenshot_path}")
+    # Chunks land in a partial file that only replaces output_path once the response is complete
+    part_path = output_path.with_name(output_path.name + ".part")
     
     try:
-        # Load the screenshot image
-        logger.debug(f"Loading screenshot image: {screenshot_path}")
-        image = Image.open(screenshot_path)
-        logger.debug(f"Image loaded successfully. Size: {image.size}")
+        image_part = await get_screenshot_part(client, screenshot_path, screenshot_bytes)
+        contents = build_style_contents(html_content, image_part)
+        logger.debug(f"Attached screenshot: {len(screenshot_bytes)} bytes")
         
         # Send both image and HTML content to Gemini
         logger.info("Sending request to Gemini 2.5 Pro")
-        response = client.models.generate_content(
-            model="gemini-2.5-pro",
-            contents=[image, prompt],
-        )
-        logger.info(f"Received response from Gemini. Length: {len(response.text)} characters")
-        return response.text
+        for attempt in range(MAX_ATTEMPTS):
+            try:
+                async with limiter:
+                    text = await stream_style_response(client, contents, part_path)
+                break
+            except errors.APIError as e:
+                if e.code not in RETRYABLE_STATUS_CODES or attempt == MAX_ATTEMPTS - 1:
+                    raise
+                delay = retry_delay(e, attempt)
+                logger.warning(f"Gemini returned {e.code}, retrying in {delay:.1f}s (attempt {attempt + 1}/{MAX_ATTEMPTS})")
+                await asyncio.sleep(delay)
+        if not text:
+            raise ValueError("empty response")
+        await asyncio.to_thread(os.replace, part_path, output_path)
+        logger.info(f"Received response from Gemini. Length: {len(text)} characters")
+        return text
     except Exception as e:
         logger.error(f"Error generating content with Gemini: {e}")
+        await asyncio.to_thread(part_path.unlink, missing_ok=True)
         return None
 
+def load_prompt_html(html_file):
+    """Return the stripped HTML for a page, reusing the stripped copy saved next to it."""
+    stripped_file = html_file.with_name("page.prompt.html")
+    try:
+        if stripped_file.stat().st_mtime >= html_file.stat().st_mtime:
+            return stripped_file.read_text(encoding='utf-8')
+    except OSError:
+        pass
+    
+    logger.debug(f"Reading HTML file: {html_file}")
+    try:
+        stripped = strip_html_file(html_file)
+    except Exception as e:
+        logger.error(f"Error reading file {html_file}: {e}")
+        return None
+    if not stripped:
+        return None
+    logger.debug(f"Stripped {html_file} to {len(stripped)} characters")
+    save_result(stripped_file, stripped)
+    return stripped
+
 def save_result(output_path, content):
     """Save the extracted style information to a text file."""
     logger.debug(f"Saving result to: {output_path}")
     try:
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.write(content)
+        Path(output_path).write_bytes(content.encode('utf-8'))
         logger.info(f"Successfully saved {len(content)} characters to {output_path}")
         return True
     except Exception as e:
         logger.error(f"Error saving result to {output_path}: {e}")
         return False
 
-def process_html_files():
-    """Process all HTML files in the extracted_designs directory."""
+def load_domain_inputs(domain_folder):
+    """Return (html_content, screenshot_file, screenshot_bytes, cache_key) for a domain, or None."""
+    # Read HTML content, stripped down to what describes the style
+    html_content = load_prompt_html(domain_folder / "page.html")
+    if not html_content:
+        logger.error(f"Skipping {domain_folder.name} due to HTML read error")
+        return None
+    
+    screenshot_file = find_screenshot(domain_folder)
+    screenshot_bytes = screenshot_file.read_bytes()
+    
+    # Identical HTML and screenshot give the same analysis, so reuse earlier responses
+    cache_key = cache.make_key(
+        html_content.encode('utf-8'),
+        screenshot_bytes,
+        f"{GEMINI_MODEL}|{PROMPT_VERSION}".encode()
+    )
+    return html_content, screenshot_file, screenshot_bytes, cache_key
+
+async def process_domain(client, domain_folder, output_dir, semaphore, limiter, writer):
+    """Run one domain through Gemini and save the result."""
+    domain_name = domain_folder.name
+    
+    async with semaphore:
+        logger.info(f"Processing: {domain_name}")
+        
+        # Read and strip on a worker thread while other domains' requests are in flight
+        inputs = await asyncio.to_thread(load_domain_inputs, domain_folder)
+        if not inputs:
+            return False
+        html_content, screenshot_file, screenshot_bytes, cache_key = inputs
+        
+        style_analysis = await asyncio.to_thread(cache.get, cache_key)
+        if style_analysis:
+            logger.info(f"Using cached style analysis for {domain_name}")
+            writer.put(output_dir / f"{domain_name}.txt", style_analysis)
+            return True
+        
+        # Extract style with Gemini using both HTML and screenshot; the response is written as it streams
+        output_file = output_dir / f"{domain_name}.txt"
+        style_analysis = await extract_style_with_gemini(
+            client, html_content, screenshot_file, screenshot_bytes, output_file, limiter
+        )
+    if not style_analysis:
+        logger.error(f"Skipping {domain_name} due to Gemini API error")
+        return False
+    
+    await asyncio.to_thread(cache.put, cache_key, GEMINI_MODEL, style_analysis)
+    logger.info(f"✓ Saved style analysis to {output_file}")
+    return True
+
+def inline_request_size(parts):
+    """Estimate the bytes a request's parts add to an inline batch job."""
+    size = 0
+    for part in parts:
+        if part.inline_data:
+            # Inline bytes are sent base64 encoded
+            size += len(part.inline_data.data) * 4 // 3
+        elif part.text:
+            size += len(part.text.encode('utf-8'))
+    return size
+
+async def run_batch_job(client, requests):
+    """Submit one inline batch job, wait for it to finish and return its responses in request order."""
+    try:
+        job = await client.aio.batches.create(
+            model=GEMINI_MODEL,
+            src=requests,
+            config={"display_name": f"style-extraction-{PROMPT_VERSION}"}
+        )
+        logger.info(f"Created batch job {job.name} with {len(requests)} requests")
+        
+        while job.state not in BATCH_DONE_STATES:
+            await asyncio.sleep(BATCH_POLL_INTERVAL)
+            job = await client.aio.batches.get(name=job.name)
+            logger.info(f"Batch job {job.name} state: {job.state}")
+    except Exception as e:
+        logger.error(f"Batch job with {len(requests)} requests failed: {e}")
+        return []
+    
+    inlined_responses = job.dest.inlined_responses if job.dest else None
+    if not inlined_responses:
+        logger.error(f"Batch job {job.name} finished as {job.state} without responses: {job.error}")
+        return []
+    return inlined_responses
+
+async def process_domains_in_batch(client, domain_folders, output_dir, writer):
+    """Send every uncached domain to Gemini in batch jobs and save the results.
+    
+    Requests are split across jobs so each stays under the inline size limit.
+    """
+    results = {}
+    pending = []
+    # Read every domain's inputs in parallel on worker threads
+    all_inputs = await asyncio.gather(
+        *(asyncio.to_thread(load_domain_inputs, domain_folder) for domain_folder in domain_folders)
+    )
+    for domain_folder, inputs in zip(domain_folders, all_inputs):
+        domain_name = domain_folder.name
+        if not inputs:
+            results[domain_name] = False
+            continue
+        html_content, screenshot_file, screenshot_bytes, cache_key = inputs
+        
+        style_analysis = await asyncio.to_thread(cache.get, cache_key)
+        if style_analysis:
+            logger.info(f"Using cached style analysis for {domain_name}")
+            writer.put(output_dir / f"{domain_name}.txt", style_analysis)
+            results[domain_name] = True
+            continue
+        
+        pending.append((domain_name, cache_key, html_content, screenshot_file, screenshot_bytes))
+    
+    if not pending:
+        return results
+    
+    # Upload the screenshots concurrently, a few at a time
+    upload_slots = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+    
+    async def upload(screenshot_file, screenshot_bytes):
+        async with upload_slots:
+            return await get_screenshot_part(client, screenshot_file, screenshot_bytes)
+    
+    image_parts = await asyncio.gather(
+        *(upload(screenshot_file, screenshot_bytes) for _, _, _, screenshot_file, screenshot_bytes in pending)
+    )
+    
+    # Pack requests into jobs by cumulative inline size
+    jobs = [[]]
+    job_size = 0
+    for (domain_name, cache_key, html_content, _, _), image_part in zip(pending, image_parts):
+        parts = build_style_contents(html_content, image_part)
+        size = inline_request_size(parts)
+        if size > BATCH_MAX_INLINE_BYTES:
+            logger.error(f"Skipping {domain_name} - its request is {size} bytes, over the {BATCH_MAX_INLINE_BYTES} byte batch limit")
+            results[domain_name] = False
+            continue
+        if jobs[-1] and job_size + size > BATCH_MAX_INLINE_BYTES:
+            jobs.append([])
+            job_size = 0
+        job_size += size
+        jobs[-1].append((domain_name, cache_key, types.InlinedRequest(
+            contents=[types.Content(role="user", parts=parts)],
+            metadata={"domain": domain_name}
+        )))
+    jobs = [job for job in jobs if job]
+    
+    logger.info(f"Submitting {sum(len(job) for job in jobs)} requests in {len(jobs)} batch jobs")
+    job_responses = await asyncio.gather(
+        *(run_batch_job(client, [request for _, _, request in job]) for job in jobs)
+    )
+    
+    for job, inlined_responses in zip(jobs, job_responses):
+        # Inline responses come back in request order
+        for (domain_name, cache_key, _), inlined in zip(job, inlined_responses):
+            style_analysis = inlined.response.text if inlined.response else None
+            if not style_analysis:
+                logger.error(f"Skipping {domain_name} due to Gemini API error: {inlined.error}")
+                results[domain_name] = False
+                continue
+            await asyncio.to_thread(cache.put, cache_key, GEMINI_MODEL, style_analysis)
+            writer.put(output_dir / f"{domain_name}.txt", style_analysis)
+            results[domain_name] = True
+        for domain_name, _, _ in job[len(inlined_responses):]:
+            results[domain_name] = False
+    return results
+
+async def process_html_files(batch=False):
+    """Process all HTML files in the extracted_designs directory.
+    
+    With batch=True every uncached domain is submitted as one Gemini batch job,
+    which is billed at a discount but may take hours to complete.
+    """
     logger.info("Starting HTML processing")
+    # Fail on a missing API key before any scanning work
+    client = get_client()
     base_dir = Path(__file__).parent
     input_dir = base_dir / "extracted_designs"
     output_dir = base_dir / "design_prompts"
@@ -109,24 +596,23 @@ def process_html_files():
         logger.info(f"Creating output directory: {output_dir}")
         output_dir.mkdir(parents=True, exist_ok=True)
     
-    # Initialize Gemini client
-    client = setup_gemini_client()
-    
-    # Get all domain folders that contain both page.html and screenshot.png
+    # Get all domain folders that contain both page.html and a screenshot
     logger.info("Scanning for valid domain folders")
     domain_folders = []
     skipped_folders = []
     
-    for folder in input_dir.iterdir():
-        if folder.is_dir() and not folder.name.startswith('.'):
-            html_file = folder / "page.html"
-            screenshot_file = folder / "screenshot.png"
-            if html_file.exists() and screenshot_file.exists():
-                domain_folders.append(folder)
-                logger.debug(f"Found valid folder: {folder.name}")
+    # One directory listing per folder instead of a stat per expected file
+    with os.scandir(input_dir) as entries:
+        for entry in entries:
+            if not entry.is_dir(follow_symlinks=False) or entry.name.startswith('.'):
+                continue
+            names = set(os.listdir(entry.path))
+            if "page.html" in names and not names.isdisjoint(SCREENSHOT_NAMES):
+                domain_folders.append(Path(entry.path))
+                logger.debug(f"Found valid folder: {entry.name}")
             else:
-                skipped_folders.append(folder.name)
-                logger.warning(f"Skipping {folder.name} - missing page.html or screenshot.png")
+                skipped_folders.append(entry.name)
+                logger.warning(f"Skipping {entry.name} - missing page.html or screenshot")
     
     if skipped_folders:
         logger.info(f"Skipped folders: {', '.join(skipped_folders)}")
@@ -138,44 +624,39 @@ def process_html_files():
     logger.info(f"Found {len(domain_folders)} domain folders to process")
     logger.info(f"Processing domains: {[f.name for f in domain_folders]}")
     
-    for i, domain_folder in enumerate(domain_folders, 1):
-        domain_name = domain_folder.name
-        logger.info(f"Processing {i}/{len(domain_folders)}: {domain_name}")
-        
-        html_file = domain_folder / "page.html"
-        screenshot_file = domain_folder / "screenshot.png"
-        
-        # Read HTML content
-        html_content = read_html_file(html_file)
-        if not html_content:
-            logger.error(f"Skipping {domain_name} due to HTML read error")
-            continue
-        
-        # Extract style with Gemini using both HTML and screenshot
-        style_analysis = extract_style_with_gemini(client, html_content, screenshot_file)
-        if not style_analysis:
-            logger.error(f"Skipping {domain_name} due to Gemini API error")
-            continue
-        
-        # Save result
-        output_file = output_dir / f"{domain_name}.txt"
-        if save_result(output_file, style_analysis):
-            logger.info(f"✓ Saved style analysis to {output_file}")
+    writer = ResultWriter()
+    try:
+        if batch:
+            results = list((await process_domains_in_batch(client, domain_folders, output_dir, writer)).values())
         else:
-            logger.error(f"✗ Failed to save {output_file}")
-        
-        # Wait 1 minute between requests (except for the last file)
-        if i < len(domain_folders):
-            logger.info("⏰ Waiting 1 minute before next request...")
-            time.sleep(60)
+            # Requests run concurrently; the limiter paces them to the quota instead of a fixed wait
+            semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+            limiter = RateLimiter(REQUESTS_PER_MINUTE)
+            results = await asyncio.gather(
+                *(process_domain(client, folder, output_dir, semaphore, limiter, writer) for folder in domain_folders),
+                return_exceptions=True
+            )
+            for domain_folder, result in zip(domain_folders, results):
+                if isinstance(result, Exception):
+                    logger.error(f"Unexpected error processing {domain_folder.name}: {result}")
+    finally:
+        # Let queued writes land before reporting
+        await writer.aclose()
     
     logger.info(f"Processing complete! Results saved in {output_dir}")
-    logger.info(f"Total domains processed: {len(domain_folders)}")
+    processed = sum(result is True for result in results) - len(writer.failed)
+    logger.info(f"Total domains processed: {processed}/{len(domain_folders)}")
 
 if __name__ == "__main__":
     logger.info("Starting Gemini HTML Style Extraction")
     try:
-        process_html_files()
+        # uvloop is optional (and unavailable on Windows, where the default loop is used)
+        try:
+            import uvloop
+        except ImportError:
+            asyncio.run(process_html_files(batch="--batch" in sys.argv))
+        else:
+            uvloop.run(process_html_files(batch="--batch" in sys.argv))
     except KeyboardInterrupt:
         logger.info("Process interrupted by user")
     except Exception as e:
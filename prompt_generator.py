@@ -2,15 +2,19 @@
 Prompt Generator - Convert extracted design tokens into AI-friendly prompts
 """
 
-import json
+from collections import Counter
+from concurrent.futures import Executor
+from functools import lru_cache
 from pathlib import Path
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Tuple
 import re
 
+import orjson
 
-class PromptGenerator:
-    def __init__(self):
-        self.template = """
+# A placeholder filling a whole template line, e.g. "{color_section}"
+_PLACEHOLDER_RE = re.compile(r'\{(\w+)\}')
+
+_TEMPLATE = """
 # Website Recreation Prompt
 
 Create a pixel-perfect recreation of this website using modern web technologies.
@@ -58,40 +62,74 @@ Create a pixel-perfect recreation of this website using modern web technologies.
 
 Please provide clean, semantic HTML and CSS code that recreates this design accurately.
 """
+
+
+@lru_cache(maxsize=None)
+def _parse_template(template: str) -> Tuple[Tuple[str, Optional[str]], ...]:
+    """Split a template into (line, placeholder name or None) pairs, once per template"""
+    parsed = []
+    for line in template.split("\n"):
+        if match := _PLACEHOLDER_RE.fullmatch(line):
+            parsed.append((line, match.group(1)))
+        elif match := _PLACEHOLDER_RE.search(line):
+            # Inline placeholders would otherwise be copied into the prompt unfilled
+            raise ValueError(f"Placeholder {match.group(0)} must sit on a line of its own: {line!r}")
+        else:
+            parsed.append((line, None))
+    return tuple(parsed)
+
+
+class PromptGenerator:
+    # Placeholders sit on lines of their own and are filled by the matching _emit_<name> method
+    template = _TEMPLATE
+    
+    # Pixel values in media query text, e.g. "(min-width: 768px)"
+    _PX_RE = re.compile(r'(\d+)px')
+    
+    def __init__(self, executor: Optional[Executor] = None):
+        # Sections are built inline unless an executor is given to build them concurrently,
+        # which only pays off once a section builder waits on I/O
+        self.executor = executor
     
     def generate_prompt(self, design_tokens: Dict[str, Any]) -> str:
         """Generate a comprehensive prompt from design tokens"""
+        template = _parse_template(self.template)
+        
+        if self.executor is not None:
+            # Build every section into its own buffer, then splice them in template order
+            sections = {
+                placeholder: self.executor.submit(self._build_section, placeholder, design_tokens)
+                for _, placeholder in template if placeholder
+            }
+        
+        # Every section emits its lines into one shared buffer that is joined once
+        lines: List[str] = []
+        for line, placeholder in template:
+            if not placeholder:
+                lines.append(line)
+            elif self.executor is None:
+                getattr(self, f"_emit_{placeholder}")(lines, design_tokens)
+            else:
+                lines.extend(sections[placeholder].result())
         
-        # Generate each section
-        typography_section = self._generate_typography_section(design_tokens)
-        color_section = self._generate_color_section(design_tokens)
-        spacing_section = self._generate_spacing_section(design_tokens)
-        components_section = self._generate_components_section(design_tokens)
-        responsive_section = self._generate_responsive_section(design_tokens)
-        animations_section = self._generate_animations_section(design_tokens)
-        implementation_notes = self._generate_implementation_notes(design_tokens)
-        
-        # Fill template
-        prompt = self.template.format(
-            typography_section=typography_section,
-            color_section=color_section,
-            spacing_section=spacing_section,
-            components_section=components_section,
-            responsive_section=responsive_section,
-            animations_section=animations_section,
-            implementation_notes=implementation_notes
-        )
-        
-        return prompt.strip()
+        return "\n".join(lines).strip()
+    
+    def _build_section(self, placeholder: str, tokens: Dict[str, Any]) -> List[str]:
+        """Build one section into a buffer of its own"""
+        section: List[str] = []
+        getattr(self, f"_emit_{placeholder}")(section, tokens)
+        return section
     
-    def _generate_typography_section(self, tokens: Dict[str, Any]) -> str:
+    def _emit_typography_section(self, section: List[str], tokens: Dict[str, Any]):
         """Generate typography section"""
         typography = tokens.get('typography_system', {})
         
         if not typography:
-            return "- Use system fonts (Arial, Helvetica, sans-serif)\n- Standard web font sizes"
+            section.append("- Use system fonts (Arial, Helvetica, sans-serif)")
+            section.append("- Standard web font sizes")
+            return
         
-        section = []
+        start = len(section)
         
         # Primary fonts
         fonts = typography.get('primary_fonts', [])
@@ -116,16 +154,16 @@ Please provide clean, semantic HTML and CSS code that recreates this design accu
             for weight in sorted(set(weights)):
                 section.append(f"- {weight}")
         
-        return "\n".join(section) if section else "- Standard web typography"
+        if len(section) == start:
+            section.append("- Standard web typography")
     
-    def _generate_color_section(self, tokens: Dict[str, Any]) -> str:
+    def _emit_color_section(self, section: List[str], tokens: Dict[str, Any]):
         """Generate color section"""
         colors = tokens.get('color_palette', {})
         
         if not colors:
-            return "- Use standard web colors"
-        
-        section = []
+            section.append("- Use standard web colors")
+            return
         
         # Primary colors
         primary = colors.get('primary_colors', [])
@@ -145,8 +183,8 @@ Please provide clean, semantic HTML and CSS code that recreates this design accu
                 section.append(f"  --{var_name}: {color};")
             section.append("}")
             section.append("```")
-        
-        return "\n".join(section) if section else "- Standard web colors"
+        else:
+            section.append("- Standard web colors")
     
     def _color_to_css_var(self, color: str, index: int) -> str:
         """Convert color to CSS variable name"""
@@ -158,20 +196,20 @@ Please provide clean, semantic HTML and CSS code that recreates this design accu
         else:
             return f"color-primary-{index+1}"
     
-    def _generate_spacing_section(self, tokens: Dict[str, Any]) -> str:
+    def _emit_spacing_section(self, section: List[str], tokens: Dict[str, Any]):
         """Generate spacing section"""
         spacing = tokens.get('spacing_scale', [])
         
         if not spacing:
-            return "- Use standard spacing: 4px, 8px, 16px, 24px, 32px, 48px, 64px"
+            section.append("- Use standard spacing: 4px, 8px, 16px, 24px, 32px, 48px, 64px")
+            return
         
-        section = []
         section.append("**Spacing Scale:**")
         
-        # Group spacing values logically
-        small_spacing = [s for s in spacing if s <= 8]
-        medium_spacing = [s for s in spacing if 8 < s <= 32]
-        large_spacing = [s for s in spacing if s > 32]
+        # Group spacing values logically in a single pass
+        small_spacing, medium_spacing, large_spacing = [], [], []
+        for s in spacing:
+            (small_spacing if s <= 8 else medium_spacing if s <= 32 else large_spacing).append(s)
         
         if small_spacing:
             section.append(f"- Small: {', '.join(map(str, small_spacing))}px")
@@ -188,17 +226,16 @@ Please provide clean, semantic HTML and CSS code that recreates this design accu
             section.append(f"  --space-{i+1}: {space}px;")
         section.append("}")
         section.append("```")
-        
-        return "\n".join(section)
     
-    def _generate_components_section(self, tokens: Dict[str, Any]) -> str:
+    def _emit_components_section(self, section: List[str], tokens: Dict[str, Any]):
         """Generate components section"""
         components = tokens.get('components', {})
         
         if not components:
-            return "- Standard web components (buttons, cards, navigation)"
+            section.append("- Standard web components (buttons, cards, navigation)")
+            return
         
-        section = []
+        start = len(section)
         
         for component_type, examples in components.items():
             if not examples:
@@ -214,66 +251,65 @@ Please provide clean, semantic HTML and CSS code that recreates this design accu
             
             section.append("")
         
-        return "\n".join(section) if section else "- Standard web components"
+        if len(section) == start:
+            section.append("- Standard web components")
     
     def _analyze_component_styles(self, examples: List[Dict[str, Any]]) -> Dict[str, str]:
         """Analyze common styles in component examples"""
         styles = {}
         
-        # Analyze common patterns
-        border_radii = []
-        background_colors = []
-        paddings = []
+        # Analyze common patterns; each example counts once per element sharing its style
+        border_radii = Counter()
+        background_colors = Counter()
+        valid_paddings = Counter()
         
         for example in examples:
+            count = example.get('count', 1)
+            
             # Border radius
             if example.get('borders', {}).get('borderRadius'):
-                border_radii.append(example['borders']['borderRadius'])
+                border_radii[example['borders']['borderRadius']] += count
             
             # Background color
             if example.get('colors', {}).get('backgroundColor'):
                 bg = example['colors']['backgroundColor']
                 if bg and 'rgba(0, 0, 0, 0)' not in bg:
-                    background_colors.append(bg)
+                    background_colors[bg] += count
             
-            # Padding
+            # Padding, keeping valid pixel values
             if example.get('spacing', {}).get('padding'):
-                paddings.extend(example['spacing']['padding'])
+                for p in example['spacing']['padding']:
+                    if p and 'px' in p:
+                        valid_paddings[p] += count
         
         # Most common values
         if border_radii:
-            most_common_radius = max(set(border_radii), key=border_radii.count)
+            most_common_radius = border_radii.most_common(1)[0][0]
             styles['Border Radius'] = most_common_radius
         
         if background_colors:
-            most_common_bg = max(set(background_colors), key=background_colors.count)
+            most_common_bg = background_colors.most_common(1)[0][0]
             styles['Background Color'] = most_common_bg
         
-        if paddings:
-            # Filter valid padding values
-            valid_paddings = [p for p in paddings if p and 'px' in p]
-            if valid_paddings:
-                most_common_padding = max(set(valid_paddings), key=valid_paddings.count)
-                styles['Padding'] = most_common_padding
+        if valid_paddings:
+            most_common_padding = valid_paddings.most_common(1)[0][0]
+            styles['Padding'] = most_common_padding
         
         return styles
     
-    def _generate_responsive_section(self, tokens: Dict[str, Any]) -> str:
+    def _emit_responsive_section(self, section: List[str], tokens: Dict[str, Any]):
         """Generate responsive section"""
         breakpoints = tokens.get('breakpoints', [])
         
-        section = []
         section.append("**Responsive Breakpoints:**")
         
         if breakpoints:
-            # Extract breakpoint values
-            breakpoint_values = set()
-            for bp in breakpoints:
-                media_text = bp.get('mediaText', '')
-                # Extract pixel values
-                pixel_matches = re.findall(r'(\d+)px', media_text)
-                for match in pixel_matches:
-                    breakpoint_values.add(int(match))
+            # Extract pixel values from every media query
+            breakpoint_values = {
+                int(match)
+                for bp in breakpoints
+                for match in self._PX_RE.findall(bp.get('mediaText', ''))
+            }
             
             if breakpoint_values:
                 sorted_breakpoints = sorted(breakpoint_values)
@@ -291,17 +327,16 @@ Please provide clean, semantic HTML and CSS code that recreates this design accu
         section.append("- Mobile-first approach")
         section.append("- Flexible grid system")
         section.append("- Scalable typography")
-        
-        return "\n".join(section)
     
-    def _generate_animations_section(self, tokens: Dict[str, Any]) -> str:
+    def _emit_animations_section(self, section: List[str], tokens: Dict[str, Any]):
         """Generate animations section"""
         animations = tokens.get('animations', {})
         
         if not animations:
-            return "- Subtle hover transitions (0.2s ease-out)\n- Smooth scroll behavior"
+            section.append("- Subtle hover transitions (0.2s ease-out)")
+            section.append("- Smooth scroll behavior")
+            return
         
-        section = []
         
         # Keyframes
         keyframes = animations.get('keyframes', [])
@@ -326,12 +361,9 @@ Please provide clean, semantic HTML and CSS code that recreates this design accu
         section.append("- Hover effects: 0.2s ease-out")
         section.append("- Focus states: 0.1s ease-in")
         section.append("- Modal/overlay: 0.3s ease-in-out")
-        
-        return "\n".join(section)
     
-    def _generate_implementation_notes(self, tokens: Dict[str, Any]) -> str:
+    def _emit_implementation_notes(self, notes: List[str], tokens: Dict[str, Any]):
         """Generate implementation-specific notes"""
-        notes = []
         
         # Font loading
         typography = tokens.get('typography_system', {})
@@ -356,13 +388,10 @@ Please provide clean, semantic HTML and CSS code that recreates this design accu
         notes.append("- Minimize CSS and JavaScript")
         notes.append("- Use CSS Grid/Flexbox instead of floats")
         notes.append("- Implement lazy loading for images")
-        
-        return "\n".join(notes)
     
     def save_prompt(self, prompt: str, output_path: Path):
         """Save generated prompt to file"""
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.write(prompt)
+        Path(output_path).write_bytes(prompt.encode('utf-8'))
         print(f"✅ Prompt saved to: {output_path}")
 
 
@@ -372,8 +401,7 @@ def generate_prompt_from_tokens(tokens_file: Path, output_file: Path = None):
         print(f"❌ Tokens file not found: {tokens_file}")
         return
     
-    with open(tokens_file, 'r') as f:
-        tokens = json.load(f)
+    tokens = orjson.loads(tokens_file.read_bytes())
     
     generator = PromptGenerator()
     prompt = generator.generate_prompt(tokens)